@@ -1,32 +1,132 @@
+import atexit
 import base64
+import functools
+import hashlib
 import json
 import os
+import queue
 import sqlite3
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from cryptography.fernet import Fernet
 
+try:
+    # Rust implementation of Fernet; same token format, several times faster
+    from rfernet import Fernet as _RFernet
+except ImportError:
+    _RFernet = None
+
 DB_PATH = Path(__file__).parent / "data" / "app.db"
 _SECRET = os.getenv("SESSION_SECRET", "change-me")
 
 
-def _get_fernet() -> Fernet:
-    # Derive a 32-byte key from SESSION_SECRET
-    import hashlib
+class _Cipher:
+    """Fernet encryption of str to str tokens over either backend.
+
+    rfernet's encrypt() returns str and its decrypt() only takes str, where
+    cryptography uses bytes; callers see the same types with both.
+    """
+
+    def __init__(self, impl: Any):
+        self._impl = impl
+
+    def encrypt(self, text: str) -> str:
+        token = self._impl.encrypt(text.encode())
+        return token if isinstance(token, str) else token.decode()
 
+    def decrypt(self, token: str) -> str:
+        data = self._impl.decrypt(token)
+        return data if isinstance(data, str) else data.decode()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_fernet() -> _Cipher:
+    # Derive a 32-byte key from SESSION_SECRET (constant for the process lifetime)
     digest = hashlib.sha256(_SECRET.encode()).digest()
-    key = base64.urlsafe_b64encode(digest)
-    return Fernet(key)
+    key = base64.urlsafe_b64encode(digest).decode()
+    fallback = _Cipher(Fernet(key))
+    if _RFernet is None:
+        return fallback
+    # Use rfernet only if its tokens round-trip and stay readable by cryptography,
+    # so stored passwords survive installing or removing it
+    try:
+        cipher = _Cipher(_RFernet(key))
+        probe = "fernet-check"
+        token = cipher.encrypt(probe)
+        if cipher.decrypt(token) == probe and fallback.decrypt(token) == probe:
+            return cipher
+    except Exception:
+        pass
+    return fallback
+
+
+_wal_enabled = False
+_local = threading.local()
+
+# Log entries are queued by insert_log and written in batches by a background thread.
+# The queue is bounded so a stalled writer cannot grow memory without limit.
+_LOG_BATCH_SIZE = 500
+_LOG_FLUSH_INTERVAL = 0.1  # seconds
+_LOG_QUEUE_SIZE = 10000
+_log_queue: "queue.Queue[Optional[Tuple[str, str, str, Optional[str]]]]" = queue.Queue(maxsize=_LOG_QUEUE_SIZE)
+# Queued by stop_log_writer; the writer finishes its batch and exits
+_LOG_STOP = None
+_log_writer: Optional[threading.Thread] = None
+_log_writer_lock = threading.Lock()
+
+# Called from the log writer with each committed batch as
+# (id, created_at, level, message, detail) rows; replaced wholesale so it can be
+# iterated without holding the lock
+_log_listeners: Tuple[Callable[[List[Tuple]], None], ...] = ()
+_log_listeners_lock = threading.Lock()
+
+# Decrypted settings/user rows, kept in memory so request handlers skip SQLite + Fernet.
+# Cleared by the matching save_* function; callers always receive a copy.
+_cache_lock = threading.RLock()
+_settings_cache: Optional[Dict[str, Any]] = None
+_user_cache: Optional[Dict[str, str]] = None
 
 
 def get_connection() -> sqlite3.Connection:
+    """Return this thread's cached connection, opening it on first use."""
+    global _wal_enabled
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # journal_mode is persistent on the DB file, so it only needs setting once
+    if not _wal_enabled:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _wal_enabled = True
+    # The remaining pragmas are per-connection
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")  # 64 MB page cache
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA busy_timeout=5000")
+    _local.conn = conn
     return conn
 
 
+def journal_mode() -> str:
+    """Return the database's active journal mode (expected: 'wal')."""
+    return get_connection().execute("PRAGMA journal_mode").fetchone()[0]
+
+
+def close_connection() -> None:
+    """Close this thread's cached connection, if any."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+
 def init_db() -> None:
     with get_connection() as conn:
         conn.execute(
@@ -68,8 +168,7 @@ def save_settings(data: Dict[str, Any]) -> None:
         data["password"] = current["password"]
     elif pwd:
         f = _get_fernet()
-        token = f.encrypt(pwd.encode())
-        data["password"] = token.decode()
+        data["password"] = f.encrypt(pwd)
 
     serialized = json.dumps(data)
     with get_connection() as conn:
@@ -78,9 +177,21 @@ def save_settings(data: Dict[str, Any]) -> None:
             (serialized,),
         )
         conn.commit()
+    # Re-read on next load so the cache always mirrors what is stored
+    global _settings_cache
+    with _cache_lock:
+        _settings_cache = None
 
 
 def load_settings() -> Optional[Dict[str, Any]]:
+    global _settings_cache
+    with _cache_lock:
+        if _settings_cache is None:
+            _settings_cache = _read_settings()
+        return dict(_settings_cache) if _settings_cache is not None else None
+
+
+def _read_settings() -> Optional[Dict[str, Any]]:
     with get_connection() as conn:
         row = conn.execute("SELECT data FROM settings WHERE id = 1").fetchone()
         if not row:
@@ -91,41 +202,216 @@ def load_settings() -> Optional[Dict[str, Any]]:
         if isinstance(pwd, str) and pwd:
             try:
                 f = _get_fernet()
-                dec = f.decrypt(pwd.encode()).decode()
-                data["password"] = dec
+                data["password"] = f.decrypt(pwd)
             except Exception:
                 # If decryption fails, treat as unset
                 data["password"] = None
         return data
 
 
+_INSERT_LOG_SQL = "INSERT INTO logs (created_at, level, message, detail) VALUES (?, ?, ?, ?)"
+
+
+def _jst_now() -> str:
+    """Current time in JST (UTC+9) as 'YYYY-MM-DD HH:MM:SS', matching SQLite's datetime()."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() + 9 * 3600))
+
+
+def _write_logs(rows: List[Tuple[str, str, str, Optional[str]]]) -> None:
+    """Insert a batch of log rows with one prepared statement in one transaction."""
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(_INSERT_LOG_SQL, rows)
+        # The write lock is held, so the batch got consecutive ids ending here.
+        # Fetched unconditionally: a listener registered before the commit must
+        # get these rows, since its backlog read may not have seen them.
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        conn.execute("COMMIT")
+    except BaseException:
+        # Also when COMMIT fails (e.g. busy): the cached connection must not
+        # stay inside the transaction, or every later BEGIN would fail
+        conn.rollback()
+        raise
+
+    listeners = _log_listeners
+    if listeners:
+        first_id = last_id - len(rows) + 1
+        written = [(first_id + i, *row) for i, row in enumerate(rows)]
+        for listener in listeners:
+            try:
+                listener(written)
+            except Exception as e:  # noqa: BLE001
+                print(f"Error in log listener: {e}")
+
+
+def add_log_listener(listener: Callable[[List[Tuple]], None]) -> None:
+    """Register a callback for newly written log rows (runs on the writer thread; keep it cheap)."""
+    global _log_listeners
+    with _log_listeners_lock:
+        _log_listeners = _log_listeners + (listener,)
+
+
+def remove_log_listener(listener: Callable[[List[Tuple]], None]) -> None:
+    global _log_listeners
+    with _log_listeners_lock:
+        _log_listeners = tuple(l for l in _log_listeners if l is not listener)
+
+
+def _log_writer_loop() -> None:
+    stopping = False
+    while not stopping:
+        batch = []
+        got = 0
+        # Gather whatever else arrives within the flush interval, up to the batch size
+        deadline = None
+        while len(batch) < _LOG_BATCH_SIZE:
+            try:
+                if deadline is None:
+                    row = _log_queue.get()
+                    deadline = time.monotonic() + _LOG_FLUSH_INTERVAL
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    row = _log_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            got += 1
+            if row is _LOG_STOP:
+                stopping = True
+                break
+            batch.append(row)
+        try:
+            if batch:
+                _write_logs(batch)
+        except sqlite3.Error as e:
+            print(f"Error writing logs: {e}")
+        finally:
+            for _ in range(got):
+                _log_queue.task_done()
+    close_connection()
+
+
+def start_log_writer() -> None:
+    """Start the background log writer if it is not already running."""
+    global _log_writer
+    if _log_writer is not None and _log_writer.is_alive():
+        return
+    with _log_writer_lock:
+        if _log_writer is None or not _log_writer.is_alive():
+            _log_writer = threading.Thread(target=_log_writer_loop, name="log-writer", daemon=True)
+            _log_writer.start()
+
+
 def insert_log(level: str, message: str, detail: Optional[str] = None) -> None:
-    with get_connection() as conn:
-        # Use JST (UTC+9) for Japan time
-        conn.execute(
-            "INSERT INTO logs (created_at, level, message, detail) VALUES (datetime('now', '+9 hours'), ?, ?, ?)",
-            (level, message, detail),
-        )
-        conn.commit()
+    """Queue a log entry; it is written by the background log writer.
+
+    The timestamp is taken here so batching does not shift it. If the queue is
+    full the row is written directly instead of blocking or being dropped.
+    """
+    start_log_writer()
+    row = (_jst_now(), level, message, detail)
+    try:
+        _log_queue.put_nowait(row)
+    except queue.Full:
+        try:
+            _write_logs([row])
+        except sqlite3.Error as e:
+            print(f"Error writing logs: {e}")
+
+
+def flush_logs() -> None:
+    """Block until every queued log entry has been written."""
+    if _log_writer is not None and _log_writer.is_alive():
+        _log_queue.join()
+
 
+def stop_log_writer(timeout: float = 5.0) -> None:
+    """Write everything still queued, then stop the writer and close its connection.
 
-def list_logs(limit: int = 200):
+    A later insert_log starts a new writer.
+    """
+    global _log_writer
+    with _log_writer_lock:
+        writer = _log_writer
+        if writer is None or not writer.is_alive():
+            return
+        _log_queue.put(_LOG_STOP)
+        writer.join(timeout)
+        if not writer.is_alive():
+            _log_writer = None
+
+
+# Daemon threads are killed at interpreter exit; drain what is queued first
+atexit.register(stop_log_writer)
+
+
+# id is the rowid alias, so ORDER BY id walks the table B-tree in either
+# direction and stops after `limit` rows (EXPLAIN QUERY PLAN: "SCAN logs" /
+# "SEARCH logs USING INTEGER PRIMARY KEY (rowid>?)", no sort step). A separate
+# index on id would be redundant and only slow down inserts. AUTOINCREMENT keeps
+# ids from being reused after clear_logs, so after_id stays a valid cursor.
+_SELECT_LATEST_LOGS_SQL = (
+    "SELECT id, created_at, level, message, detail FROM logs ORDER BY id DESC LIMIT ?"
+)
+# Delta reads go oldest first: with more than `limit` new rows, the caller
+# continues from the last id it got instead of skipping the rows in between
+_SELECT_LOGS_AFTER_SQL = (
+    "SELECT id, created_at, level, message, detail FROM logs WHERE id > ? ORDER BY id LIMIT ?"
+)
+
+
+def _select_logs(conn, limit: int, after_id: int):
+    if after_id > 0:
+        return conn.execute(_SELECT_LOGS_AFTER_SQL, (after_id, limit))
+    return conn.execute(_SELECT_LATEST_LOGS_SQL, (limit,))
+
+
+def list_logs(limit: int = 200, after_id: int = 0):
+    """The newest `limit` rows, newest first; with after_id, the first `limit`
+    rows after it, oldest first."""
     with get_connection() as conn:
-        rows = conn.execute(
-            "SELECT id, created_at, level, message, detail FROM logs ORDER BY id DESC LIMIT ?",
-            (limit,),
-        ).fetchall()
+        rows = _select_logs(conn, limit, after_id).fetchall()
     return [dict(row) for row in rows]
 
 
+def iter_log_batches(limit: int = 200, after_id: int = 0, batch_size: int = 500) -> Iterator[List[Tuple]]:
+    """Yield the rows list_logs would return, batch_size at a time,
+    as (id, created_at, level, message, detail).
+
+    Uses a dedicated connection so a streaming response may advance the
+    generator from whichever worker thread it happens to run on.
+    """
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    try:
+        cur = _select_logs(conn, limit, after_id)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
 def clear_logs() -> None:
     """Delete all log entries from the database."""
+    flush_logs()
     with get_connection() as conn:
         conn.execute("DELETE FROM logs")
         conn.commit()
 
 def load_user() -> Optional[Dict[str, str]]:
     """Load login user credentials (username and password)."""
+    global _user_cache
+    with _cache_lock:
+        if _user_cache is None:
+            _user_cache = _read_user()
+        return dict(_user_cache) if _user_cache is not None else None
+
+
+def _read_user() -> Optional[Dict[str, str]]:
     with get_connection() as conn:
         row = conn.execute("SELECT username, password FROM users WHERE id = 1").fetchone()
         if not row:
@@ -137,7 +423,7 @@ def load_user() -> Optional[Dict[str, str]]:
         # Decrypt password
         try:
             f = _get_fernet()
-            decrypted_password = f.decrypt(encrypted_password.encode()).decode()
+            decrypted_password = f.decrypt(encrypted_password)
             return {"username": username, "password": decrypted_password}
         except Exception:
             # If decryption fails, return None
@@ -149,10 +435,13 @@ def save_user(username: str, password: str) -> None:
     with get_connection() as conn:
         # Encrypt password before storing
         f = _get_fernet()
-        encrypted_password = f.encrypt(password.encode()).decode()
+        encrypted_password = f.encrypt(password)
         
         conn.execute(
             "INSERT INTO users (id, username, password) VALUES (1, ?, ?) ON CONFLICT(id) DO UPDATE SET username = excluded.username, password = excluded.password",
             (username, encrypted_password),
         )
-        conn.commit()
\ No newline at end of file
+        conn.commit()
+    global _user_cache
+    with _cache_lock:
+        _user_cache = {"username": username, "password": password}
\ No newline at end of file
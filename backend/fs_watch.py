@@ -0,0 +1,149 @@
+"""File system change notification shared by the compress and upload watchers."""
+
+import queue
+import threading
+import time
+from typing import Callable, Optional, Set
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional; watchers fall back to periodic scans
+    FileSystemEventHandler = object
+    Observer = None
+
+# Seconds without further events before a burst of file changes is processed
+EVENT_SETTLE_SECONDS = 0.5
+
+# Idle wait periods (of `interval` seconds) before an event-driven watcher does a
+# full sweep anyway, to pick up anything the OS failed to report
+SWEEP_EVERY_TICKS = 6
+
+_QUEUE_SIZE = 10000
+
+
+def sleep_unless_stopped(timeout: float, stop_check: Optional[Callable[[], bool]] = None) -> bool:
+    """Sleep up to `timeout` seconds, returning True as soon as a stop is requested.
+
+    When stop_check is a threading.Event's is_set (as the job runners pass),
+    this blocks on the event itself so a stop wakes the caller immediately.
+    """
+    if stop_check is None:
+        time.sleep(timeout)
+        return False
+    event = getattr(stop_check, "__self__", None)
+    if isinstance(event, threading.Event):
+        return event.wait(timeout)
+    deadline = time.monotonic() + timeout
+    while not stop_check():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(0.1, remaining))
+    return True
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """Queue paths of created, modified or moved-in files reported by watchdog."""
+
+    def __init__(self, watcher: "ChangeWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher._put(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher._put(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher._put(event.dest_path)
+
+
+class ChangeWatcher:
+    """Collect changed file paths under a directory tree using watchdog.
+
+    start() returns False when events are unavailable (watchdog missing or the
+    observer failed); callers then keep rescanning on their own schedule.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.error: Optional[str] = None
+        self._changes: "queue.Queue[str]" = queue.Queue(maxsize=_QUEUE_SIZE)
+        self._overflowed = False
+        self._observer = None
+
+    @property
+    def active(self) -> bool:
+        return self._observer is not None
+
+    def start(self) -> bool:
+        if Observer is None:
+            self.error = "watchdog がインストールされていません"
+            return False
+        try:
+            observer = Observer()
+            observer.schedule(_ChangeHandler(self), self.root, recursive=True)
+            observer.start()
+        except Exception as e:  # noqa: BLE001
+            self.error = str(e)
+            return False
+        self._observer = observer
+        return True
+
+    def stop(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def _put(self, path: str) -> None:
+        try:
+            self._changes.put_nowait(path)
+        except queue.Full:
+            # Too many to track individually; the next wait() asks for a full rescan
+            self._overflowed = True
+
+    def wait(self, timeout: float, stop_check: Optional[Callable[[], bool]] = None) -> Optional[Set[str]]:
+        """Block up to `timeout` seconds for changes and return the changed paths.
+
+        A burst of events is coalesced until EVENT_SETTLE_SECONDS pass quietly.
+        Returns None if nothing changed (or stop was requested) before the
+        timeout, and an empty set if events were dropped and the caller should
+        rescan the whole tree.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if stop_check and stop_check():
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                changed = {self._changes.get(timeout=min(0.1, remaining))}
+                break
+            except queue.Empty:
+                if self._overflowed:
+                    changed = set()
+                    break
+
+        while not (stop_check and stop_check()):
+            try:
+                changed.add(self._changes.get(timeout=EVENT_SETTLE_SECONDS))
+            except queue.Empty:
+                break
+
+        if self._overflowed:
+            self._overflowed = False
+            return set()
+        return changed
+
+    def __enter__(self) -> "ChangeWatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
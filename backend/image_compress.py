@@ -1,53 +1,133 @@
 """Image compression module for SFTP Sync Service."""
 
+import io
+import multiprocessing
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, Iterable, Iterator, Optional
 
-from PIL import Image
+from PIL import Image, features
+
+from fs_watch import SWEEP_EVERY_TICKS, ChangeWatcher, sleep_unless_stopped
+
+try:
+    import numpy as np
+    from turbojpeg import TJPF_RGB, TJSAMP_420, TurboJPEG
+except ImportError:  # PyTurboJPEG is optional; Pillow encodes when it is missing
+    TurboJPEG = None
 
 # Supported image extensions
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff', '.tif'}
+_IMAGE_SUFFIXES = tuple(IMAGE_EXTENSIONS)
+
+# Log level ordering; messages below the configured minimum are never formatted or queued
+_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARN': 30, 'ERROR': 40}
+_min_level = _LEVELS['INFO']
+
+
+def set_log_level(level: str) -> None:
+    """Set the minimum level that compression log messages are emitted at."""
+    global _min_level
+    _min_level = _LEVELS.get(level, _LEVELS['INFO'])
+
+
+def _enabled(level: str) -> bool:
+    return _LEVELS[level] >= _min_level
+
+
+# One TurboJPEG handle per process, created on first use (None if unavailable)
+_turbojpeg = None
+_turbojpeg_loaded = False
+
+
+def _get_turbojpeg():
+    global _turbojpeg, _turbojpeg_loaded
+    if not _turbojpeg_loaded:
+        _turbojpeg_loaded = True
+        if TurboJPEG is not None:
+            try:
+                _turbojpeg = TurboJPEG()
+            except (OSError, RuntimeError):
+                # Python bindings installed but libturbojpeg itself not found
+                _turbojpeg = None
+    return _turbojpeg
 
 
 def is_image_file(file_path: str) -> bool:
     """Check if file is a supported image format."""
-    return Path(file_path).suffix.lower() in IMAGE_EXTENSIONS
+    return file_path.lower().endswith(_IMAGE_SUFFIXES)
+
+
+def has_libjpeg_turbo() -> bool:
+    """Check if Pillow's JPEG codec is backed by libjpeg-turbo (SIMD DCT/Huffman)."""
+    try:
+        return bool(features.check_feature('libjpeg_turbo'))
+    except Exception:
+        return False
+
+
+def _output_jpeg_path(output_dir: str, rel_path: str) -> str:
+    """Return the .jpg output path for an input file at rel_path."""
+    return os.path.splitext(os.path.join(output_dir, rel_path))[0] + '.jpg'
+
+
+def _ensure_dir(path: str, created_dirs: set) -> None:
+    """Create path once per created_dirs cache."""
+    if path not in created_dirs:
+        os.makedirs(path, exist_ok=True)
+        created_dirs.add(path)
 
 
 def compress_image(
     input_path: str,
-    output_path: str,
+    output_jpeg_path: str,
     quality: int = 85,
     resize_width: Optional[int] = None,
+    original_size: Optional[int] = None,
+    fast_encode: bool = False,
 ) -> dict:
     """
     Compress a single image file.
 
     Args:
         input_path: Source image file path
-        output_path: Destination file path
+        output_jpeg_path: Destination JPEG path (its directory must already exist)
         quality: Compression quality (1-100)
         resize_width: Target width in pixels (optional, height auto-calculated to maintain aspect ratio)
+        original_size: Size of input_path in bytes if the caller already stat'ed it
+        fast_encode: Skip the optimized-Huffman second pass (~2x faster encode, ~3-8% larger files)
 
     Returns:
         dict with original_size, compressed_size, and saved_bytes
     """
-    original_size = os.path.getsize(input_path)
+    if original_size is None:
+        original_size = os.path.getsize(input_path)
 
     with Image.open(input_path) as img:
         original_dimensions = img.size  # (width, height)
 
-        # Convert to RGB if necessary (for PNG with alpha, etc.)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            # Create white background for transparent images
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when shrinking a large JPEG.
+        # Keep at least 2x the target size so the LANCZOS pass below still has detail to work with.
+        if resize_width and img.format == 'JPEG' and resize_width * 2 < original_dimensions[0]:
+            orig_w, orig_h = original_dimensions
+            try:
+                img.draft('RGB', (resize_width * 2, max(1, orig_h * resize_width * 2 // orig_w)))
+            except Exception:
+                pass
+
+        # Convert to RGB if necessary (for PNG with alpha, etc.); RGB input is used as-is
+        if img.mode != 'RGB':
+            if img.mode == 'P' and 'transparency' in img.info:
                 img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
+            if 'A' in img.getbands() and img.getchannel('A').getextrema()[0] < 255:
+                # Composite onto a white background only when some pixel is actually transparent
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel('A'))
+                img = background
+            else:
+                img = img.convert('RGB')
 
         # Resize if width is specified (height auto-calculated to maintain aspect ratio)
         if resize_width:
@@ -55,34 +135,82 @@ def compress_image(
             resize_height = int(orig_h * resize_width / orig_w)
             img = img.resize((resize_width, resize_height), Image.Resampling.LANCZOS)
 
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-        # Save as JPEG with specified quality
-        output_jpeg = Path(output_path).with_suffix('.jpg')
-        img.save(str(output_jpeg), 'JPEG', quality=quality, optimize=True)
+        # Encode in memory so the size is known without a stat and readers never see a partial file.
+        # TurboJPEG skips Pillow's per-call encoder setup but cannot emit optimized Huffman
+        # tables, so it is only used when fast_encode already gives those up.
+        tj = _get_turbojpeg() if fast_encode else None
+        if tj is not None:
+            data = tj.encode(np.asarray(img), quality=quality, pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
+        else:
+            buf = io.BytesIO()
+            img.save(buf, 'JPEG', quality=quality, optimize=not fast_encode, progressive=False)
+            data = buf.getbuffer()
 
         new_dimensions = img.size
 
-    compressed_size = os.path.getsize(str(output_jpeg))
+    compressed_size = len(data)
+    tmp_path = output_jpeg_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, output_jpeg_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
     return {
         'original_size': original_size,
         'compressed_size': compressed_size,
         'saved_bytes': original_size - compressed_size,
-        'output_path': str(output_jpeg),
+        'output_path': output_jpeg_path,
         'original_dimensions': original_dimensions,
         'new_dimensions': new_dimensions,
     }
 
 
+def _compress_one(task: tuple) -> tuple:
+    """Process pool worker: compress one image and return (rel_path, result, error)."""
+    input_file, output_jpeg, rel_path, quality, resize_width, original_size, fast_encode = task
+    try:
+        return rel_path, compress_image(input_file, output_jpeg, quality, resize_width, original_size, fast_encode), None
+    except Exception as e:
+        return rel_path, None, str(e)
+
+
+def _new_executor() -> ProcessPoolExecutor:
+    """Create a process pool sized to the CPU count for compress_image tasks."""
+    # "spawn" keeps workers independent of the server's threads and open sqlite handles
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context('spawn'),
+    )
+
+
+def _iter_images(root: str) -> Iterator[str]:
+    """Yield paths of all image files under root, using scandir's cached entry types."""
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _iter_images(entry.path)
+        elif is_image_file(entry.name) and entry.is_file():
+            yield entry.path
+
+
 def compress_images_in_folder(
     input_dir: str,
     output_dir: str,
     quality: int = 85,
-    log_callback: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    log_callback: Optional[Callable[..., None]] = None,
     stop_check: Optional[Callable[[], bool]] = None,
     resize_width: Optional[int] = None,
+    fast_encode: bool = False,
 ) -> dict:
     """
     Compress all images in a folder.
@@ -91,21 +219,23 @@ def compress_images_in_folder(
         input_dir: Source directory containing images
         output_dir: Destination directory for compressed images
         quality: Compression quality (1-100)
-        log_callback: Function to log messages (level, message, detail)
+        log_callback: Function to log messages (level, message, *args, detail=None)
         stop_check: Function to check if operation should stop
+        resize_width: Target width in pixels (optional)
+        fast_encode: Trade ~3-8% larger files for ~2x faster JPEG encoding
 
     Returns:
         dict with total_files, compressed_files, skipped_files, total_saved_bytes
     """
-    def log(level: str, message: str, detail: Optional[str] = None):
-        if log_callback:
-            log_callback(level, message, detail)
+    def log(level: str, message: str, *args, detail: Optional[str] = None):
+        if log_callback and _enabled(level):
+            log_callback(level, message, *args, detail=detail)
 
     input_path = Path(input_dir)
     output_path = Path(output_dir)
 
     if not input_path.exists():
-        log("ERROR", f"入力フォルダーが存在しません: {input_dir}")
+        log("ERROR", "入力フォルダーが存在しません: %s", input_dir)
         return {
             'total_files': 0,
             'compressed_files': 0,
@@ -116,10 +246,10 @@ def compress_images_in_folder(
 
     # Create output directory
     output_path.mkdir(parents=True, exist_ok=True)
-    log("INFO", f"画像圧縮処理開始: {input_dir} → {output_dir}")
-    log("INFO", f"圧縮品質: {quality}")
+    log("INFO", "画像圧縮処理開始: %s → %s", input_dir, output_dir)
+    log("INFO", "圧縮品質: %s", quality)
     if resize_width:
-        log("INFO", f"リサイズ設定: 横幅{resize_width}dpi (縦は比率保持)")
+        log("INFO", "リサイズ設定: 横幅%sdpi (縦は比率保持)", resize_width)
 
     stats = {
         'total_files': 0,
@@ -129,47 +259,53 @@ def compress_images_in_folder(
         'total_saved_bytes': 0,
     }
 
-    # Walk through all files in input directory
-    for root, dirs, files in os.walk(input_dir):
+    # Collect all image files in input directory, creating each output folder once
+    tasks = []
+    created_dirs = {output_dir}
+    for input_file in _iter_images(input_dir):
         if stop_check and stop_check():
-            log("WARN", "画像圧縮処理が停止されました")
             break
 
-        for filename in files:
-            if stop_check and stop_check():
-                break
-
-            input_file = os.path.join(root, filename)
+        # Calculate relative path for output
+        rel_path = os.path.relpath(input_file, input_dir)
+        output_jpeg = _output_jpeg_path(output_dir, rel_path)
+        _ensure_dir(os.path.dirname(output_jpeg), created_dirs)
+        tasks.append((input_file, output_jpeg, rel_path, quality, resize_width, None, fast_encode))
 
-            if not is_image_file(input_file):
-                continue
+    stats['total_files'] = len(tasks)
 
-            stats['total_files'] += 1
+    # Compress in parallel; results stream back in order and are tallied here
+    if tasks and not (stop_check and stop_check()):
+        with _new_executor() as executor:
+            for rel_path, result, error in executor.map(_compress_one, tasks, chunksize=8):
+                if stop_check and stop_check():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
 
-            # Calculate relative path for output
-            rel_path = os.path.relpath(input_file, input_dir)
-            output_file = os.path.join(output_dir, rel_path)
+                if error is not None:
+                    stats['error_files'] += 1
+                    log("ERROR", "圧縮エラー: %s", rel_path, detail=error)
+                    continue
 
-            try:
-                result = compress_image(input_file, output_file, quality, resize_width)
                 stats['compressed_files'] += 1
                 stats['total_saved_bytes'] += result['saved_bytes']
 
+                if not _enabled('INFO'):
+                    continue
                 original_kb = result['original_size'] / 1024
                 compressed_kb = result['compressed_size'] / 1024
                 saved_kb = result['saved_bytes'] / 1024
                 orig_dim = result.get('original_dimensions', (0, 0))
                 new_dim = result.get('new_dimensions', (0, 0))
                 resize_info = f", {orig_dim[0]}×{orig_dim[1]} → {new_dim[0]}×{new_dim[1]}" if resize_width else ""
-                log("INFO", f"圧縮完了: {rel_path} ({original_kb:.1f}KB → {compressed_kb:.1f}KB, 削減: {saved_kb:.1f}KB{resize_info})")
+                log("INFO", "圧縮完了: %s (%.1fKB → %.1fKB, 削減: %.1fKB%s)", rel_path, original_kb, compressed_kb, saved_kb, resize_info)
 
-            except Exception as e:
-                stats['error_files'] += 1
-                log("ERROR", f"圧縮エラー: {rel_path}", detail=str(e))
+    if stop_check and stop_check():
+        log("WARN", "画像圧縮処理が停止されました")
 
     # Log final summary
     saved_mb = stats['total_saved_bytes'] / (1024 * 1024)
-    log("INFO", f"画像圧縮処理完了: 合計={stats['total_files']}件, 圧縮={stats['compressed_files']}件, スキップ={stats['skipped_files']}件, エラー={stats['error_files']}件, 削減={saved_mb:.2f}MB")
+    log("INFO", "画像圧縮処理完了: 合計=%d件, 圧縮=%d件, スキップ=%d件, エラー=%d件, 削減=%.2fMB", stats['total_files'], stats['compressed_files'], stats['skipped_files'], stats['error_files'], saved_mb)
 
     return stats
 
@@ -178,36 +314,43 @@ def watch_and_compress(
     input_dir: str,
     output_dir: str,
     quality: int = 85,
-    log_callback: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    log_callback: Optional[Callable[..., None]] = None,
     stop_check: Optional[Callable[[], bool]] = None,
     interval: float = 5.0,
     resize_width: Optional[int] = None,
+    fast_encode: bool = False,
 ) -> dict:
     """
     Continuously watch input folder and compress new/modified images.
 
+    When watchdog is installed, file system events drive compression and only
+    changed files are looked at; otherwise the folder is rescanned every interval.
+
     Args:
         input_dir: Source directory containing images
         output_dir: Destination directory for compressed images
         quality: Compression quality (1-100)
-        log_callback: Function to log messages (level, message, detail)
+        log_callback: Function to log messages (level, message, *args, detail=None)
         stop_check: Function to check if operation should stop
-        interval: Seconds between each scan cycle
+        interval: Seconds between each scan cycle (polling mode only)
+        resize_width: Target width in pixels (optional)
+        fast_encode: Trade ~3-8% larger files for ~2x faster JPEG encoding
 
     Returns:
         dict with total stats from all cycles
     """
-    import time
+    def log(level: str, message: str, *args, detail: Optional[str] = None):
+        if log_callback and _enabled(level):
+            log_callback(level, message, *args, detail=detail)
 
-    def log(level: str, message: str, detail: Optional[str] = None):
-        if log_callback:
-            log_callback(level, message, detail)
+    def stopped() -> bool:
+        return bool(stop_check and stop_check())
 
     input_path = Path(input_dir)
     output_path = Path(output_dir)
 
     if not input_path.exists():
-        log("ERROR", f"入力フォルダーが存在しません: {input_dir}")
+        log("ERROR", "入力フォルダーが存在しません: %s", input_dir)
         return {
             'total_files': 0,
             'compressed_files': 0,
@@ -229,73 +372,108 @@ def watch_and_compress(
 
     cycle_count = 0
 
-    log("INFO", f"画像圧縮監視開始: {input_dir} → {output_dir}")
+    log("INFO", "画像圧縮監視開始: %s → %s", input_dir, output_dir)
     resize_info = f", リサイズ: 横幅{resize_width}dpi (縦は比率保持)" if resize_width else ""
-    log("INFO", f"監視間隔: {interval}秒, 圧縮品質: {quality}{resize_info}")
+    log("INFO", "監視間隔: %s秒, 圧縮品質: %s%s", interval, quality, resize_info)
 
-    while not (stop_check and stop_check()):
+    def run_cycle(executor: ProcessPoolExecutor, input_files: Iterable[str]) -> None:
+        """Compress every file in input_files whose output is missing or older."""
+        nonlocal cycle_count
         cycle_count += 1
         cycle_compressed = 0
         cycle_skipped = 0
         cycle_errors = 0
 
-        # Walk through all files in input directory
-        for root, dirs, files in os.walk(input_dir):
-            if stop_check and stop_check():
+        tasks = []
+        created_dirs = {output_dir}
+        for input_file in input_files:
+            if stopped():
                 break
 
-            for filename in files:
-                if stop_check and stop_check():
-                    break
-
-                input_file = os.path.join(root, filename)
+            # Calculate relative path for output
+            rel_path = os.path.relpath(input_file, input_dir)
+            output_jpeg = _output_jpeg_path(output_dir, rel_path)
 
-                if not is_image_file(input_file):
+            # Skip if output file exists and is newer than input (one stat per file)
+            try:
+                in_st = os.stat(input_file)
+            except FileNotFoundError:
+                continue
+            try:
+                if os.stat(output_jpeg).st_mtime >= in_st.st_mtime:
+                    cycle_skipped += 1
                     continue
+            except FileNotFoundError:
+                pass
 
-                # Calculate relative path for output
-                rel_path = os.path.relpath(input_file, input_dir)
-                output_file = os.path.join(output_dir, rel_path)
-                output_jpeg = Path(output_file).with_suffix('.jpg')
-
-                # Check if output file exists and is newer than input
-                if output_jpeg.exists():
-                    input_mtime = os.path.getmtime(input_file)
-                    output_mtime = os.path.getmtime(str(output_jpeg))
-                    if output_mtime >= input_mtime:
-                        cycle_skipped += 1
-                        continue
-
-                try:
-                    result = compress_image(input_file, output_file, quality, resize_width)
-                    cycle_compressed += 1
-                    total_stats['compressed_files'] += 1
-                    total_stats['total_saved_bytes'] += result['saved_bytes']
-
-                    original_kb = result['original_size'] / 1024
-                    compressed_kb = result['compressed_size'] / 1024
-                    saved_kb = result['saved_bytes'] / 1024
-                    orig_dim = result.get('original_dimensions', (0, 0))
-                    new_dim = result.get('new_dimensions', (0, 0))
-                    dim_info = f", {orig_dim[0]}×{orig_dim[1]} → {new_dim[0]}×{new_dim[1]}" if resize_width else ""
-                    log("INFO", f"圧縮完了: {rel_path} ({original_kb:.1f}KB → {compressed_kb:.1f}KB, 削減: {saved_kb:.1f}KB{dim_info})")
-
-                except Exception as e:
+            _ensure_dir(os.path.dirname(output_jpeg), created_dirs)
+            tasks.append((input_file, output_jpeg, rel_path, quality, resize_width, in_st.st_size, fast_encode))
+
+        if tasks and not stopped():
+            for rel_path, result, error in executor.map(_compress_one, tasks, chunksize=8):
+                if stopped():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+
+                if error is not None:
                     cycle_errors += 1
                     total_stats['error_files'] += 1
-                    log("ERROR", f"圧縮エラー: {rel_path}", detail=str(e))
+                    log("ERROR", "圧縮エラー: %s", rel_path, detail=error)
+                    continue
+
+                cycle_compressed += 1
+                total_stats['compressed_files'] += 1
+                total_stats['total_saved_bytes'] += result['saved_bytes']
+
+                if not _enabled('INFO'):
+                    continue
+                original_kb = result['original_size'] / 1024
+                compressed_kb = result['compressed_size'] / 1024
+                saved_kb = result['saved_bytes'] / 1024
+                orig_dim = result.get('original_dimensions', (0, 0))
+                new_dim = result.get('new_dimensions', (0, 0))
+                dim_info = f", {orig_dim[0]}×{orig_dim[1]} → {new_dim[0]}×{new_dim[1]}" if resize_width else ""
+                log("INFO", "圧縮完了: %s (%.1fKB → %.1fKB, 削減: %.1fKB%s)", rel_path, original_kb, compressed_kb, saved_kb, dim_info)
 
         total_stats['skipped_files'] += cycle_skipped
 
         if cycle_compressed > 0 or cycle_errors > 0:
-            log("INFO", f"[監視サイクル {cycle_count}] 圧縮={cycle_compressed}件, スキップ={cycle_skipped}件, エラー={cycle_errors}件")
+            log("INFO", "[監視サイクル %d] 圧縮=%d件, スキップ=%d件, エラー=%d件", cycle_count, cycle_compressed, cycle_skipped, cycle_errors)
+
+    # Start watching before the initial scan so no change in between is missed
+    with ChangeWatcher(input_dir) as watcher:
+        if watcher.start():
+            log("INFO", "ファイル変更イベント監視を使用します (watchdog)")
+        else:
+            log("WARN", "ファイル変更イベント監視を開始できません: 定期スキャンで監視します", detail=watcher.error)
+
+        # One pool for the whole watch so worker startup is paid only once
+        with _new_executor() as executor:
+            # Catch up on everything already in the folder
+            run_cycle(executor, _iter_images(input_dir))
+
+            idle_ticks = 0
+            while not stopped():
+                if not watcher.active:
+                    # Wait before next cycle, then rescan the whole tree
+                    if not sleep_unless_stopped(interval, stop_check):
+                        run_cycle(executor, _iter_images(input_dir))
+                    continue
 
-        # Wait before next cycle
-        if not (stop_check and stop_check()):
-            for _ in range(int(interval * 10)):
-                if stop_check and stop_check():
-                    break
-                time.sleep(0.1)
+                changed = watcher.wait(interval, stop_check)
+                if changed is None:
+                    # Quiet period: sweep now and then in case an event was missed
+                    idle_ticks += 1
+                    if idle_ticks >= SWEEP_EVERY_TICKS and not stopped():
+                        idle_ticks = 0
+                        run_cycle(executor, _iter_images(input_dir))
+                    continue
+                idle_ticks = 0
+                if not changed:
+                    # Events were dropped: fall back to a full rescan
+                    run_cycle(executor, _iter_images(input_dir))
+                    continue
+                run_cycle(executor, sorted(p for p in changed if is_image_file(p) and os.path.isfile(p)))
 
-    log("WARN", f"画像圧縮監視停止: 合計{cycle_count}サイクル実行")
+    log("WARN", "画像圧縮監視停止: 合計%dサイクル実行", cycle_count)
     return total_stats
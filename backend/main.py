@@ -1,710 +1,396 @@
-import base64
+import asyncio
+import gzip
 import hashlib
 import hmac
 import os
+import sqlite3
 import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+from urllib.parse import quote, unquote
 
-from fastapi import Cookie, Depends, FastAPI, HTTPException, Response
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
+import orjson
+import paramiko
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; the page is then served gzip-only
+    brotli = None
 
 import db
-from image_compress import compress_images_in_folder, watch_and_compress
+from image_compress import compress_images_in_folder, has_libjpeg_turbo, set_log_level, watch_and_compress
 from schemas import LogEntry, SftpSettings, Status, SyncRequest
-from sftp_sync import sync_once, test_connection
+from sftp_sync import SftpConnectionError, sync_once, test_connection
 from sftp_upload import watch_and_upload
 
-app = FastAPI(title="SFTP Sync Service")
+app = FastAPI(title="SFTP Sync Service", default_response_class=ORJSONResponse)
+# Held by a job's worker for the whole run; locked() is the job's running state
 lock = threading.Lock()
 compress_lock = threading.Lock()
 upload_lock = threading.Lock()
 _last_run: Optional[str] = None
-_running = False
-_stop_requested = False
-_compress_running = False
-_compress_stop_requested = False
-_upload_running = False
-_upload_stop_requested = False
+# Set by the stop endpoints; worker threads block on these instead of polling
+_sync_stop = threading.Event()
+_compress_stop = threading.Event()
+_upload_stop = threading.Event()
 APP_USER = os.getenv("APP_USER", "admin")
 APP_PASSWORD = os.getenv("APP_PASSWORD", "password")
 SESSION_SECRET = os.getenv("SESSION_SECRET", "change-me")
+_SECRET_B = SESSION_SECRET.encode()
+# Pre-keyed HMAC state; copy() clones it so each token skips re-absorbing the key
+_HMAC_TEMPLATE = hmac.new(_SECRET_B, digestmod=hashlib.sha256)
 SESSION_NAME = "session"
+JST = timezone(timedelta(hours=9))
+# Shown in place of stored passwords; responses never carry the real value
+_MASKED_PW = "********"
+_DEFAULT_USERS = {"username": "admin", "password": _MASKED_PW}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:8000", "http://127.0.0.1:8000"],
-    allow_credentials=True,
-    allow_methods=["*"]
-    ,
-    allow_headers=["*"],
-)
 
+# Minimum level written to the log table (APP_LOG_LEVEL=DEBUG/INFO/WARN/ERROR)
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+_MIN_LEVEL = LOG_LEVELS.get(os.getenv("APP_LOG_LEVEL", "INFO").upper(), LOG_LEVELS["INFO"])
 
-def _log(level: str, message: str, detail: Optional[str] = None) -> None:
+
+def _log(level: str, message: str, *args, detail: Optional[str] = None) -> None:
+    """Queue a log row. With args, message is a %-template formatted only if the level is enabled."""
+    if LOG_LEVELS.get(level, 20) < _MIN_LEVEL:
+        return
+    if args:
+        message = message % args
     db.insert_log(level, message, detail)
 
 
 def _sign_token(username: str, issued: int) -> str:
-    payload = f"{username}:{issued}"
-    sig = hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).digest()
-    return base64.urlsafe_b64encode(payload.encode() + b"|" + sig).decode()
+    # Flat "<quoted username>.<issued>.<hex hmac>" token: cookie-safe without base64
+    payload = f"{quote(username, safe='')}.{issued}"
+    h = _HMAC_TEMPLATE.copy()
+    h.update(payload.encode("ascii"))
+    sig = h.hexdigest()
+    return f"{payload}.{sig}"
+
+
+# Verified tokens -> (username, expires_at); repeat requests skip parsing and the HMAC,
+# and a hit costs one dict lookup plus one clock comparison.
+# Only valid tokens are stored, and the least recently used entry is evicted past the limit.
+_TOKEN_CACHE_SIZE = 1024
+_TOKEN_TTL = 60 * 60 * 12
+_token_cache: "OrderedDict[str, tuple[str, int]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
 
 
 def _verify_token(token: str) -> Optional[str]:
-    try:
-        raw = base64.urlsafe_b64decode(token.encode())
-        payload, sig = raw.rsplit(b"|", 1)
-        username, issued_str = payload.decode().split(":", 1)
-    except Exception:
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+        if cached is not None:
+            _token_cache.move_to_end(token)
+    if cached is not None:
+        username, expires_at = cached
+        if time.time() > expires_at:
+            with _token_cache_lock:
+                _token_cache.pop(token, None)
+            return None
+        return username
+
+    payload, _, sig = token.rpartition(".")
+    quoted_user, _, issued_str = payload.rpartition(".")
+    if not quoted_user or not issued_str.isdigit() or not token.isascii():
         return None
 
-    expected = hmac.new(SESSION_SECRET.encode(), payload, hashlib.sha256).digest()
+    h = _HMAC_TEMPLATE.copy()
+    h.update(payload.encode("ascii"))
+    expected = h.hexdigest()
     if not hmac.compare_digest(expected, sig):
         return None
 
     # Optional expiration (12h)
-    issued = int(issued_str)
-    if time.time() - issued > 60 * 60 * 12:
+    username = unquote(quoted_user)
+    expires_at = int(issued_str) + _TOKEN_TTL
+    if time.time() > expires_at:
         return None
+    with _token_cache_lock:
+        _token_cache[token] = (username, expires_at)
+        if len(_token_cache) > _TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
     return username
 
 
-def require_auth(session: Optional[str] = Cookie(default=None, alias=SESSION_NAME)):
-    if not session:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    user = _verify_token(session)
-    if not user:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    return user
+# Paths reachable without a session; everything else needs a valid session cookie
+PUBLIC_PATHS = frozenset({"/", "/auth/login", "/auth/logout", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"})
+_UNAUTHORIZED_BODY = b'{"detail":"Unauthorized"}'
+_UNAUTHORIZED_START = {
+    "type": "http.response.start",
+    "status": 401,
+    "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(_UNAUTHORIZED_BODY)).encode()),
+    ],
+}
+_UNAUTHORIZED_BODY_MESSAGE = {"type": "http.response.body", "body": _UNAUTHORIZED_BODY}
+_WS_POLICY_CLOSE = {"type": "websocket.close", "code": 1008}
+
+
+_SESSION_KEY = SESSION_NAME.encode() + b"="
+
+
+def _session_from_headers(headers) -> Optional[str]:
+    # Slice the one cookie we need out of the raw header bytes instead of parsing them all
+    for name, value in headers:
+        if name != b"cookie":
+            continue
+        idx = value.find(_SESSION_KEY)
+        # Skip matches inside another cookie's name, e.g. "xsession="
+        while idx > 0 and value[idx - 1] not in b" ;":
+            idx = value.find(_SESSION_KEY, idx + 1)
+        if idx == -1:
+            continue
+        start = idx + len(_SESSION_KEY)
+        end = value.find(b";", start)
+        token = value[start:end if end != -1 else None].strip().strip(b'"')
+        try:
+            return token.decode("ascii")
+        except UnicodeDecodeError:
+            return None
+    return None
+
+
+class AuthASGIMiddleware:
+    """Reject requests without a valid session cookie before routing.
+
+    Works on the raw ASGI scope so protected endpoints skip building a Request
+    and resolving a dependency. The username is stored in scope["state"]["user"].
+    WebSocket handshakes are checked the same way and closed with 1008 on failure.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        scope_type = scope["type"]
+        if scope_type == "lifespan" or (scope_type == "http" and (scope["method"] == "OPTIONS" or scope["path"] in PUBLIC_PATHS)):
+            await self.app(scope, receive, send)
+            return
+
+        session = _session_from_headers(scope["headers"])
+        user = _verify_token(session) if session else None
+        if not user:
+            if scope_type == "websocket":
+                # Reject the handshake (the server answers it with 403)
+                await receive()
+                await send(_WS_POLICY_CLOSE)
+                return
+            await send(_UNAUTHORIZED_START)
+            await send(_UNAUTHORIZED_BODY_MESSAGE)
+            return
+
+        scope.setdefault("state", {})["user"] = user
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(AuthASGIMiddleware)
+# Added last so it wraps the auth layer: preflights and 401 responses still carry CORS headers
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:8000", "http://127.0.0.1:8000"],
+    allow_credentials=True,
+    # Explicit lists let Starlette answer preflights from precomputed headers
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["Content-Type"],
+)
 
 
-def _check_stop_requested() -> bool:
-    """Check if stop was requested. Used as callback for sync_once."""
-    global _stop_requested
-    return _stop_requested
+class _SettingsCache:
+    """Latest validated settings plus a version bumped on every save.
 
+    Job runners read settings from here instead of loading and re-validating the
+    DB row each time. Long-running loops compare the version each cycle and only
+    pick up a new SftpSettings object when it changed.
+    """
 
-def _check_compress_stop_requested() -> bool:
-    """Check if compress stop was requested."""
-    global _compress_stop_requested
-    return _compress_stop_requested
+    def __init__(self):
+        self.version = 0
+        self.settings: Optional[SftpSettings] = None
+        self._masked: Optional[SftpSettings] = None
+        self.loaded = False
+        self.lock = threading.Lock()
 
+    def get(self) -> Optional[SftpSettings]:
+        """Return the current settings, loading them from the DB on first use."""
+        with self.lock:
+            if not self.loaded:
+                data = db.load_settings()
+                self.settings = SftpSettings.model_validate(data) if data else None
+                self.loaded = True
+            return self.settings
 
-def _check_upload_stop_requested() -> bool:
-    """Check if upload stop was requested."""
-    global _upload_stop_requested
-    return _upload_stop_requested
+    def masked(self) -> Optional[SftpSettings]:
+        """Return the current settings with the password masked, as sent to the UI."""
+        settings = self.get()
+        with self.lock:
+            if self._masked is None and settings is not None:
+                # Fixed mask string if a password is stored, so its length is not revealed
+                self._masked = settings.model_copy(update={"password": _MASKED_PW if settings.password else None})
+            return self._masked
+
+    def bump(self, settings: SftpSettings) -> None:
+        with self.lock:
+            self.settings = settings
+            self._masked = None
+            self.loaded = True
+            self.version += 1
+
+    def snapshot(self) -> tuple[Optional[SftpSettings], int]:
+        with self.lock:
+            return self.settings, self.version
+
+
+_settings_cache = _SettingsCache()
 
 
 def _run_sync() -> None:
-    global _last_run, _running, _stop_requested
-    settings_data = db.load_settings()
-    if not settings_data:
-        _log("WARN", "同期スキップ: 設定が未構成です")
+    global _last_run
+    # Locals for the names the monitoring loop hits every cycle
+    log = _log
+    stop = _sync_stop
+    # Version first: a save landing in between only causes one redundant reload
+    settings_version = _settings_cache.version
+    settings = _settings_cache.get()
+    if settings is None:
+        log("WARN", "同期スキップ: 設定が未構成です")
         return
 
-    settings = SftpSettings(**settings_data)
     if not lock.acquire(blocking=False):
-        _log("INFO", "同期スキップ: 既に実行中です")
+        log("INFO", "同期スキップ: 既に実行中です")
         return
-    _running = True
-    _stop_requested = False
+    stop.clear()
+    _notify_status()
 
     try:
-        _log("INFO", f"同期監視開始: {settings.host} → {settings.local_dir}")
+        log("INFO", "同期監視開始: %s → %s", settings.host, settings.local_dir)
         
         # 秒数が0の場合は1回のみ実行
         if settings.sync_interval_seconds == 0:
-            _log("INFO", "1回のみ実行モード")
+            log("INFO", "1回のみ実行モード")
             cycle_count = 1
             try:
-                _log("INFO", f"[監視サイクル {cycle_count}] 差異チェック開始")
-                summary = sync_once(settings, _log, _check_stop_requested)
+                log("INFO", "[監視サイクル %d] 差異チェック開始", cycle_count)
+                summary = sync_once(settings, log, stop.is_set)
                 if summary['copied'] > 0:
-                    _log("INFO", f"[監視サイクル {cycle_count}] 差異検出 - コピー={summary['copied']}件")
+                    log("INFO", "[監視サイクル %d] 差異検出 - コピー=%d件", cycle_count, summary['copied'])
                 else:
-                    _log("INFO", f"[監視サイクル {cycle_count}] 差異なし")
+                    log("INFO", "[監視サイクル %d] 差異なし", cycle_count)
             except Exception as exc:  # noqa: BLE001
-                _log("ERROR", f"[監視サイクル {cycle_count}] 同期処理エラー", detail=str(exc))
-            _log("INFO", f"同期監視終了: 1回実行完了")
+                log("ERROR", "[監視サイクル %d] 同期処理エラー", cycle_count, detail=str(exc))
+            log("INFO", "同期監視終了: 1回実行完了")
         else:
-            _log("INFO", f"継続的監視モード: 監視間隔={settings.sync_interval_seconds}秒")
+            log("INFO", "継続的監視モード: 監視間隔=%s秒", settings.sync_interval_seconds)
             cycle_count = 0
-            while not _stop_requested:
+            while not stop.is_set():
                 cycle_count += 1
+                # Pick up settings saved while the loop is running
+                if _settings_cache.version != settings_version:
+                    latest, settings_version = _settings_cache.snapshot()
+                    if latest is not None:
+                        settings = latest
+                        log("INFO", "[監視サイクル %d] 設定の変更を反映しました", cycle_count)
+                # 0 (run once) only applies at start; a live change to 0 must not spin
+                interval = max(settings.sync_interval_seconds, 1)
                 try:
-                    _log("INFO", f"[監視サイクル {cycle_count}] 差異チェック開始")
-                    summary = sync_once(settings, _log, _check_stop_requested)
+                    log("INFO", "[監視サイクル %d] 差異チェック開始", cycle_count)
+                    summary = sync_once(settings, log, stop.is_set)
 
-                    if _stop_requested:
-                        _log("WARN", f"同期監視停止: ユーザーによる停止要求 (サイクル={cycle_count}回)")
+                    if stop.is_set():
+                        log("WARN", "同期監視停止: ユーザーによる停止要求 (サイクル=%d回)", cycle_count)
                         break
 
                     if summary['copied'] > 0:
-                        _log("INFO", f"[監視サイクル {cycle_count}] 差異検出 - コピー={summary['copied']}件")
+                        log("INFO", "[監視サイクル %d] 差異検出 - コピー=%d件", cycle_count, summary['copied'])
                     else:
-                        _log("INFO", f"[監視サイクル {cycle_count}] 差異なし - 次のチェックまで待機")
+                        log("INFO", "[監視サイクル %d] 差異なし - 次のチェックまで待機", cycle_count)
 
-                    # Wait specified seconds before next check (unless stop requested)
-                    interval_ms = settings.sync_interval_seconds
-                    for _ in range(interval_ms * 10):  # *10 for 0.1s increments
-                        if _stop_requested:
-                            break
-                        time.sleep(0.1)
+                    # Wait specified seconds before next check; a stop request wakes us immediately
+                    if stop.wait(interval):
+                        break
 
                 except Exception as exc:  # noqa: BLE001
-                    _log("ERROR", f"[監視サイクル {cycle_count}] 同期処理エラー", detail=str(exc))
+                    log("ERROR", "[監視サイクル %d] 同期処理エラー", cycle_count, detail=str(exc))
                     # Continue monitoring even after error
-                    time.sleep(settings.sync_interval_seconds)
+                    stop.wait(interval)
 
-            _log("INFO", f"同期監視終了: 合計{cycle_count}サイクル実行")
+            log("INFO", "同期監視終了: 合計%dサイクル実行", cycle_count)
 
     except Exception as exc:  # noqa: BLE001
-        _log("ERROR", "同期監視失敗: 予期しないエラーが発生しました", detail=str(exc))
+        log("ERROR", "同期監視失敗: 予期しないエラーが発生しました", detail=str(exc))
     finally:
-        _running = False
-        _stop_requested = False
+        stop.clear()
         lock.release()
-        _last_run = db.get_connection().execute("SELECT datetime('now', '+9 hours')").fetchone()[0]
+        _last_run = datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
+        _notify_status()
+
+
+# One pool for the three background jobs. Threads are created on first use and
+# reused afterwards; a job already running rejects new runs (409 at the
+# endpoint, lock check in the runner), so each job needs at most one thread.
+_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="job-worker")
+
+
+def _run_job(name: str, target) -> None:
+    try:
+        target()
+    except Exception as exc:  # noqa: BLE001
+        _log("ERROR", "バックグラウンド処理エラー: %s", name, detail=str(exc))
+
+
+def _submit_job(name: str, target) -> None:
+    _executor.submit(_run_job, name, target)
 
 
 @app.on_event("startup")
 def on_startup() -> None:
     db.init_db()
+    db.start_log_writer()
+    mode = db.journal_mode()
+    if mode.lower() == "wal":
+        _log("INFO", "データベース: WALモード (synchronous=NORMAL) で動作しています")
+    else:
+        _log("WARN", "データベース: WALモードを有効にできませんでした (journal_mode=%s)", mode)
+    if not has_libjpeg_turbo():
+        _log("WARN", "Pillowがlibjpeg-turboでビルドされていません: JPEG圧縮が低速になります")
+
+
+# Lightweight HTML/JS login + menu UI served directly from the API host.
+# The page is static: read, encode and gzip it once at import instead of on every request
+_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+with open(os.path.join(_STATIC_DIR, "index.html"), "rb") as _f:
+    _ROOT_HTML_BYTES = _f.read()
+_ROOT_HTML_GZ = gzip.compress(_ROOT_HTML_BYTES, compresslevel=9)
+_ROOT_HTML_BR = brotli.compress(_ROOT_HTML_BYTES, quality=11) if brotli is not None else None
+# Weak so the same tag covers the gzip and identity encodings of the page
+_ROOT_HTML_ETAG = 'W/"' + hashlib.sha1(_ROOT_HTML_BYTES).hexdigest() + '"'
+# Always revalidate so a redeploy shows up at once; unchanged pages cost a 304
+_ROOT_HTML_HEADERS = {"Vary": "Accept-Encoding", "ETag": _ROOT_HTML_ETAG, "Cache-Control": "no-cache"}
 
 
 @app.get("/", response_class=HTMLResponse)
-def root_page():
-    # Lightweight HTML/JS login + menu UI served directly from the API host.
-    return """
-        <!DOCTYPE html>
-        <html lang=\"ja\">
-        <head>
-            <meta charset=\"UTF-8\" />
-            <meta name=\"viewport\" content=\"width=device-width, initial-scale=1\" />
-            <title>SFTP画像圧縮処理システム</title>
-            <style>
-                :root { font-family: 'Segoe UI', system-ui, sans-serif; background: #0f172a; color: #e2e8f0; }
-                body { margin: 0; padding: 24px; }
-                body.login-mode { display: flex; align-items: center; justify-content: center; min-height: 100vh; }
-                .card { background: #111827; border: 1px solid #1f2937; border-radius: 12px; padding: 20px; max-width: 100%; box-shadow: 0 10px 40px rgba(0,0,0,0.35); }
-                body.login-mode .card { max-width: 720px; width: 100%; }
-                h1 { margin-top: 0; font-size: 22px; letter-spacing: 0.3px; }
-                label { display: block; margin: 8px 0 4px; font-size: 13px; color: #cbd5e1; }
-                input { width: 100%; padding: 10px 12px; border-radius: 8px; border: 1px solid #1f2937; background: #0b1220; color: #e2e8f0; }
-                button { background: linear-gradient(90deg, #22c55e, #16a34a); border: none; color: #0b1220; font-weight: 700; padding: 10px 16px; border-radius: 10px; cursor: pointer; box-shadow: 0 8px 20px rgba(34,197,94,0.25); white-space: nowrap; flex-shrink: 0; }
-                button:disabled { opacity: 0.4; cursor: not-allowed; }
-                .row { display: flex; gap: 8px; margin-top: 12px; overflow-x: auto; align-items: center; padding-bottom: 8px; }
-                .row::-webkit-scrollbar { height: 6px; }
-                .row::-webkit-scrollbar-track { background: #0b1220; border-radius: 3px; }
-                .row::-webkit-scrollbar-thumb { background: #1f2937; border-radius: 3px; }
-                .menu { display: none; }
-                .section { margin-top: 18px; padding: 14px; border: 1px solid #1f2937; border-radius: 10px; background: #0b1220; }
-                pre { background: #0b1220; padding: 12px; border-radius: 10px; border: 1px solid #1f2937; color: #cbd5e1; overflow-x: auto; }
-                .tag { display: inline-block; padding: 3px 8px; border-radius: 999px; background: #1e293b; color: #e2e8f0; font-size: 12px; margin-right: 6px; }
-                a { color: #38bdf8; text-decoration: none; }
-            </style>
-        </head>
-        <body class=\"login-mode\">
-            <div class=\"card\">
-                <h1>SFTP画像圧縮処理システム</h1>
-                <div id=\"auth\">
-                    <label for=\"user\">ユーザー名</label>
-                    <input id=\"user\" value=\"admin\" maxlength=\"20\" style=\"max-width: 300px;\" />
-                    <label for=\"pass\">パスワード</label>
-                    <input id=\"pass\" type=\"password\" value=\"password\" maxlength=\"20\" style=\"max-width: 300px;\" />
-                    <div class=\"row\">
-                        <button id=\"loginBtn\">ログイン</button>
-                    </div>
-                    <p id=\"msg\" style=\"color:#f472b6; margin-top:8px\"></p>
-                </div>
-                <div id=\"menu\" class=\"menu\">
-                    <div class=\"row\">
-                        <button id=\"btnEditSettings\">設定を編集</button>
-                        <button id=\"btnManageUsers\">ユーザー管理</button>
-                        <button id=\"btnLogs\">ログ表示</button>
-                        <button id=\"btnClearLogs\" style=\"background: linear-gradient(90deg,#94a3b8,#64748b); color:#0b1220;\">ログクリア</button>
-                        <button id=\"btnSyncToggle\" style=\"background: linear-gradient(90deg,#3b82f6,#2563eb); color:#0b1220;\">SFTPから取込 開始</button>
-                        <button id=\"btnCompressToggle\" style=\"background: linear-gradient(90deg,#3b82f6,#2563eb); color:#0b1220;\">画像圧縮 開始</button>
-                        <button id=\"btnUploadToggle\" style=\"background: linear-gradient(90deg,#3b82f6,#2563eb); color:#0b1220;\">SFTPアップ 開始</button>
-                        <button id=\"logoutBtn\" style=\"margin-left:auto; background: linear-gradient(90deg,#f97316,#ea580c); color:#0b1220\">ログアウト</button>
-                    </div>
-                    <div id=\"panel\" class=\"section\"></div>
-                </div>
-            </div>
-
-            <script>
-                const msg = document.getElementById('msg');
-                const menu = document.getElementById('menu');
-                const auth = document.getElementById('auth');
-                const panel = document.getElementById('panel');
-
-                async function api(path, opts = {}) {
-                    const res = await fetch(path, {
-                        credentials: 'include',
-                        headers: { 'Content-Type': 'application/json', ...(opts.headers||{}) },
-                        ...opts,
-                    });
-                    if (!res.ok) throw new Error(await res.text() || res.statusText);
-                    return res.status === 204 ? null : res.json();
-                }
-
-                async function checkAuth() {
-                    try {
-                        await api('/auth/me');
-                        auth.style.display = 'none';
-                        menu.style.display = 'block';
-                        document.body.classList.remove('login-mode');
-                        msg.textContent = '';
-                        // Check sync status on login/reload to restore button state
-                        // Wait for next tick to ensure DOM is ready
-                        setTimeout(() => checkSyncStatus(), 0);
-                        setTimeout(() => checkCompressStatus(), 0);
-                        setTimeout(() => checkUploadStatus(), 0);
-                    } catch {
-                        auth.style.display = 'block';
-                        menu.style.display = 'none';
-                        document.body.classList.add('login-mode');
-                    }
-                }
-
-                async function login() {
-                    msg.textContent = '';
-                    try {
-                        const username = document.getElementById('user').value;
-                        const password = document.getElementById('pass').value;
-                        await api('/auth/login', { method: 'POST', body: JSON.stringify({ username, password }) });
-                        await checkAuth();
-                    } catch (e) {
-                        msg.textContent = e.message || 'login failed';
-                    }
-                }
-
-                async function logout() {
-                    await api('/auth/logout', { method: 'POST' });
-                    await checkAuth();
-                    panel.innerHTML = '';
-                }
-                                async function editSettings() {
-                                        try {
-                                                const current = await api('/settings');
-                                                const s = current || { host:'', port:22, username:'', password:null, private_key_path:'', remote_dir:'', local_dir:'', compress_output_dir:'', compress_quality:85, remote_output_dir:'' };
-                                                const hasPassword = s.password === '********';
-                                                panel.innerHTML = `
-                                                    <div class=\"tag\">Settings</div>
-                                                    <div class=\"section\">
-                                                        <label>接続先ドメイン (host)</label>
-                                                        <input id=\"f_host\" value=\"${s.host || ''}\" />
-                                                        <label>ポート (port)</label>
-                                                        <input id=\"f_port\" type=\"number\" value=\"${s.port ?? 22}\" />
-                                                        <label>ユーザー (username)</label>
-                                                        <input id=\"f_user\" value=\"${s.username || ''}\" />
-                                                        <label>パスワード (password)</label>
-                                                        <input id=\"f_pass\" type=\"password\" value=\"${hasPassword ? s.password : ''}\" placeholder=\"${hasPassword ? '' : '新しいパスワードを入力'}\" />
-                                                        ${hasPassword ? '<p style=\"color:#94a3b8; font-size:12px; margin:4px 0 10px\">※パスワードが保存されています (上記のマスク表示: ********)。変更する場合のみ新しいパスワードを入力してください。</p>' : ''}
-                                                        <label>接続先フォルダー (remote_dir)</label>
-                                                        <input id=\"f_remote\" value=\"${s.remote_dir || ''}\" />
-                                                        <label>接続先出力フォルダー (remote_output_dir)</label>
-                                                        <input id=\"f_remote_output\" value=\"${s.remote_output_dir || ''}\" placeholder=\"任意: SFTP接続先への出力先\" />
-                                                        <label>コピー先フォルダー (local_dir)</label>
-                                                        <input id=\"f_local\" value=\"${s.local_dir || ''}\" />
-                                                        <label>画像圧縮出力先フォルダー (compress_output_dir)</label>
-                                                        <input id=\"f_compress\" value=\"${s.compress_output_dir || ''}\" placeholder=\"任意: 画像圧縮後の出力先\" />
-                                                        <label>画像圧縮率 (compress_quality: 1-100)</label>
-                                                        <input id=\"f_quality\" type=\"number\" min=\"1\" max=\"100\" value=\"${s.compress_quality ?? 85}\" />
-                                                        <p style=\"color:#94a3b8; font-size:12px; margin:4px 0 10px\">※数値が大きいほど高画質（ファイルサイズ大）、小さいほど低画質（ファイルサイズ小）</p>
-                                                        <label>画像リサイズ 横幅dpi</label>
-                                                        <input id=\"f_resize_width\" type=\"number\" min=\"1\" value=\"${s.resize_width_dpi || ''}\" placeholder=\"横幅dpi\" style=\"width:160px;\" />
-                                                        <p style=\"color:#94a3b8; font-size:12px; margin:4px 0 10px\">※未入力の場合はリサイズしません。横幅を指定すると縦はアスペクト比を保持して自動計算されます。</p>
-                                                        <label>SFTP取込 監視間隔 (sync_interval_seconds)</label>
-                                                        <input id=\"f_sync_interval\" type=\"number\" min=\"1\" value=\"${s.sync_interval_seconds ?? 5}\" />
-                                                        <p style=\"color:#94a3b8; font-size:12px; margin:4px 0 10px\">※秒単位: SFTPから取込処理の監視間隔</p>
-                                                        <label>画像圧縮 監視間隔 (compress_interval_seconds)</label>
-                                                        <input id=\"f_compress_interval\" type=\"number\" min=\"1\" value=\"${s.compress_interval_seconds ?? 10}\" />
-                                                        <p style=\"color:#94a3b8; font-size:12px; margin:4px 0 10px\">※秒単位: 画像圧縮処理の監視間隔</p>
-                                                        <label>SFTPアップロード 監視間隔 (upload_interval_seconds)</label>
-                                                        <input id=\"f_upload_interval\" type=\"number\" min=\"1\" value=\"${s.upload_interval_seconds ?? 10}\" />
-                                                        <p style=\"color:#94a3b8; font-size:12px; margin:4px 0 10px\">※秒単位: SFTPアップロード処理の監視間隔</p>
-                                                        <div class=\"row\" style=\"margin-top:10px\">
-                                                            <button id=\"saveSettings\">保存</button>
-                                                            <button id=\"testSettings\" style=\"background: linear-gradient(90deg,#60a5fa,#3b82f6); color:#0b1220\">接続テスト</button>
-                                                        </div>
-                                                    </div>
-                                                `;
-                                                document.getElementById('saveSettings').onclick = async () => {
-                                                    const saveBtn = document.getElementById('saveSettings');
-                                                    const testBtn = document.getElementById('testSettings');
-                                                    try {
-                                                        const passwordValue = (document.getElementById('f_pass')).value;
-                                                        const resizeWidth = (document.getElementById('f_resize_width')).value;
-                                                        const payload = {
-                                                            host: (document.getElementById('f_host')).value,
-                                                            port: parseInt((document.getElementById('f_port')).value || '22'),
-                                                            username: (document.getElementById('f_user')).value,
-                                                            password: passwordValue === '********' ? '' : passwordValue,
-                                                            remote_dir: (document.getElementById('f_remote')).value,
-                                                            remote_output_dir: (document.getElementById('f_remote_output')).value,
-                                                            local_dir: (document.getElementById('f_local')).value,
-                                                            compress_output_dir: (document.getElementById('f_compress')).value,
-                                                            compress_quality: parseInt((document.getElementById('f_quality')).value || '85'),
-                                                            resize_width_dpi: resizeWidth ? parseInt(resizeWidth) : null,
-                                                            sync_interval_seconds: parseInt((document.getElementById('f_sync_interval')).value || '5'),
-                                                            compress_interval_seconds: parseInt((document.getElementById('f_compress_interval')).value || '10'),
-                                                            upload_interval_seconds: parseInt((document.getElementById('f_upload_interval')).value || '10'),
-                                                        };
-                                                        // simple client-side validation
-                                                        if (!payload.host || !payload.username || (!payload.password && !hasPassword && !s.private_key_path) || !payload.remote_dir || !payload.local_dir) {
-                                                            panel.innerHTML += `<p style="color:#f472b6">必須項目が未入力です</p>`;
-                                                            return;
-                                                        }
-                                                        saveBtn.disabled = true;
-                                                        testBtn.disabled = true;
-                                                        panel.innerHTML += `<p style="color:#94a3b8">保存中...</p>`;
-                                                        await api('/settings', { method: 'POST', body: JSON.stringify(payload) });
-                                                        panel.innerHTML = `<p style="color:#4ade80">保存しました。スケジューラーが更新されます。</p>`;
-                                                        
-                                                        // メインメニューに戻る
-                                                        setTimeout(() => {
-                                                            panel.innerHTML = '';
-                                                            showMenu();
-                                                        }, 1500);
-                                                    } catch (e) {
-                                                        panel.innerHTML += `<p style="color:#f472b6">${e.message}</p>`;
-                                                    } finally {
-                                                        saveBtn.disabled = false;
-                                                        testBtn.disabled = false;
-                                                    }
-                                                };
-                                                document.getElementById('testSettings').onclick = async () => {
-                                                    const saveBtn = document.getElementById('saveSettings');
-                                                    const testBtn = document.getElementById('testSettings');
-                                                    const statusMsg = document.createElement('p');
-                                                    statusMsg.style.color = '#94a3b8';
-                                                    statusMsg.style.marginTop = '10px';
-                                                    statusMsg.textContent = '接続テスト中...';
-                                                    panel.appendChild(statusMsg);
-
-                                                    try {
-                                                        saveBtn.disabled = true;
-                                                        testBtn.disabled = true;
-
-                                                        const passwordValue = (document.getElementById('f_pass')).value;
-                                                        const testResizeWidth = (document.getElementById('f_resize_width')).value;
-                                                        const payload = {
-                                                            host: (document.getElementById('f_host')).value,
-                                                            port: parseInt((document.getElementById('f_port')).value || '22'),
-                                                            username: (document.getElementById('f_user')).value,
-                                                            password: passwordValue === '********' ? '' : passwordValue,
-                                                            remote_dir: (document.getElementById('f_remote')).value,
-                                                            remote_output_dir: (document.getElementById('f_remote_output')).value,
-                                                            local_dir: (document.getElementById('f_local')).value,
-                                                            compress_output_dir: (document.getElementById('f_compress')).value,
-                                                            compress_quality: parseInt((document.getElementById('f_quality')).value || '85'),
-                                                            resize_width_dpi: testResizeWidth ? parseInt(testResizeWidth) : null,
-                                                            sync_interval_seconds: parseInt((document.getElementById('f_sync_interval')).value || '5'),
-                                                            compress_interval_seconds: parseInt((document.getElementById('f_compress_interval')).value || '10'),
-                                                            upload_interval_seconds: parseInt((document.getElementById('f_upload_interval')).value || '10'),
-                                                        };
-                                                        await api('/settings/test', { method: 'POST', body: JSON.stringify(payload) });
-                                                        statusMsg.style.color = '#4ade80';
-                                                        statusMsg.textContent = '✓ 接続テスト成功';
-                                                    } catch (e) {
-                                                        statusMsg.style.color = '#f472b6';
-                                                        statusMsg.textContent = `✗ ${e.message}`;
-                                                    } finally {
-                                                        saveBtn.disabled = false;
-                                                        testBtn.disabled = false;
-                                                    }
-                                                };
-                                        } catch (e) {
-                                                panel.innerHTML = `<p style=\"color:#f472b6\">${e.message}</p>`;
-                                        }
-                                }
-
-                async function showLogs() {
-                    try {
-                        const data = await api('/logs?limit=1000');
-                        const levelColors = {
-                            'INFO': '#4ade80',
-                            'WARN': '#fbbf24',
-                            'ERROR': '#f87171'
-                        };
-                        const logsHtml = data.map(log => {
-                            const color = levelColors[log.level] || '#94a3b8';
-                            const detail = log.detail ? `<div style="margin-left:20px; color:#94a3b8; font-size:11px; margin-top:4px;">詳細: ${log.detail}</div>` : '';
-                            return `
-                                <div style="margin-bottom:12px; padding:10px; background:#0b1220; border-radius:8px; border-left:3px solid ${color};">
-                                    <div style="display:flex; align-items:center; gap:10px;">
-                                        <span style="color:${color}; font-weight:700; font-size:11px; min-width:50px;">${log.level}</span>
-                                        <span style="color:#64748b; font-size:11px;">${log.created_at}</span>
-                                    </div>
-                                    <div style="color:#e2e8f0; margin-top:6px;">${log.message}</div>
-                                    ${detail}
-                                </div>
-                            `;
-                        }).join('');
-                        panel.innerHTML = `
-                            <div class="tag">ログ (最新1000件)</div>
-                            <div style="max-height:500px; overflow-y:auto; margin-top:10px;">
-                                ${logsHtml || '<p style="color:#94a3b8;">ログがありません</p>'}
-                            </div>
-                        `;
-                    } catch (e) {
-                        panel.innerHTML = `<p style="color:#f472b6">${e.message}</p>`;
-                    }
-                }
-
-                function showMenu() {
-                    panel.innerHTML = '';
-                }
-
-                async function manageUsers() {
-                    try {
-                        const current = await api('/users');
-                        panel.innerHTML = `
-                            <div class="tag">ユーザー管理</div>
-                            <div class="section">
-                                <label>ユーザーID (username)</label>
-                                <input id="f_username" value="${current.username || 'admin'}" />
-                                <label>パスワード (password)</label>
-                                <input id="f_user_password" type="password" placeholder="新しいパスワードを入力" />
-                                <p style="color:#94a3b8; font-size:12px; margin:4px 0 10px">※次回ログイン時から新しい認証情報が有効になります</p>
-                                <div class="row" style="margin-top:10px">
-                                    <button id="saveUsers">保存</button>
-                                </div>
-                            </div>
-                        `;
-                        
-                        document.getElementById('saveUsers').onclick = async () => {
-                            const saveBtn = document.getElementById('saveUsers');
-                            try {
-                                const username = (document.getElementById('f_username')).value.trim();
-                                const password = (document.getElementById('f_user_password')).value.trim();
-                                
-                                if (!username) {
-                                    panel.innerHTML += `<p style="color:#f472b6">ユーザーIDは必須です</p>`;
-                                    return;
-                                }
-                                if (!password) {
-                                    panel.innerHTML += `<p style="color:#f472b6">パスワードは必須です</p>`;
-                                    return;
-                                }
-                                
-                                saveBtn.disabled = true;
-                                panel.innerHTML += `<p style="color:#94a3b8">保存中...</p>`;
-                                
-                                const payload = { username, password };
-                                await api('/users', { method: 'POST', body: JSON.stringify(payload) });
-                                panel.innerHTML = `<p style="color:#4ade80">ユーザー情報を保存しました。次回ログイン時から新しい認証情報が有効になります。</p>`;
-                                
-                                // メインメニューに戻る
-                                setTimeout(() => {
-                                    panel.innerHTML = '';
-                                    showMenu();
-                                }, 1500);
-                            } catch (e) {
-                                panel.innerHTML += `<p style="color:#f472b6">${e.message}</p>`;
-                                saveBtn.disabled = false;
-                            }
-                        };
-                    } catch (e) {
-                        panel.innerHTML = `<p style="color:#f472b6">${e.message}</p>`;
-                    }
-                }
-
-                async function clearLogs() {
-                    const btnClearLogs = document.getElementById('btnClearLogs');
-                    if (!confirm('全てのログを削除してもよろしいですか?')) {
-                        return;
-                    }
-                    try {
-                        btnClearLogs.disabled = true;
-                        await api('/logs', { method: 'DELETE' });
-                        panel.innerHTML = `<p style="color:#4ade80">ログをクリアしました。</p>`;
-                        // Auto-refresh logs to show empty state
-                        setTimeout(showLogs, 1000);
-                    } catch (e) {
-                        panel.innerHTML = `<p style="color:#f472b6">${e.message}</p>`;
-                    } finally {
-                        btnClearLogs.disabled = false;
-                    }
-                }
-
-                function updateSyncToggleButton(running) {
-                    const btn = document.getElementById('btnSyncToggle');
-                    if (running) {
-                        btn.textContent = 'SFTPから取込 停止';
-                        btn.style.background = 'linear-gradient(90deg,#ef4444,#dc2626)';
-                    } else {
-                        btn.textContent = 'SFTPから取込 開始';
-                        btn.style.background = 'linear-gradient(90deg,#3b82f6,#2563eb)';
-                    }
-                }
-
-                async function toggleSync() {
-                    const status = await api('/status');
-                    if (status.running) {
-                        // Currently running, stop it
-                        await api('/sync/stop', { method: 'POST' });
-                        panel.innerHTML = '<p style="color:#fbbf24">監視停止を要求しました。現在の処理が完了するまでお待ちください。</p>';
-                    } else {
-                        // Currently stopped, start it
-                        const settings = await api('/settings');
-                        const interval = (settings?.sync_interval_seconds !== undefined && settings?.sync_interval_seconds !== null) ? settings.sync_interval_seconds : 5;
-                        await api('/sync/run', { method: 'POST', body: JSON.stringify({ force: true }) });
-                        if (interval === 0) {
-                            panel.innerHTML = '<p style="color:#4ade80">1回のみ同期を実行します。処理完了後は自動的に停止します。</p>';
-                        } else {
-                            panel.innerHTML = `
-                                <p style="color:#4ade80">継続的監視モードを開始しました</p>
-                                <p style="color:#94a3b8; margin-top:8px;">両フォルダを${interval}秒毎に監視し、差異があれば自動的に同期します。</p>
-                            `;
-                        }
-                    }
-                    setTimeout(checkSyncStatus, 1000);
-                }
-
-                async function checkSyncStatus() {
-                    try {
-                        const status = await api('/status');
-                        updateSyncToggleButton(status.running);
-                        document.getElementById('btnSyncToggle').disabled = false;
-                        if (status.running) {
-                            setTimeout(checkSyncStatus, 2000);
-                        }
-                    } catch (e) {
-                        console.error('Status check failed:', e);
-                        updateSyncToggleButton(false);
-                        document.getElementById('btnSyncToggle').disabled = false;
-                    }
-                }
-
-                function updateCompressToggleButton(isRunning) {
-                    const btn = document.getElementById('btnCompressToggle');
-                    if (isRunning) {
-                        btn.textContent = '画像圧縮 停止';
-                        btn.style.background = 'linear-gradient(90deg,#ef4444,#dc2626)';
-                    } else {
-                        btn.textContent = '画像圧縮 開始';
-                        btn.style.background = 'linear-gradient(90deg,#3b82f6,#2563eb)';
-                    }
-                }
-
-                async function toggleCompress() {
-                    const btn = document.getElementById('btnCompressToggle');
-                    try {
-                        const settings = await api('/settings');
-                        const interval = (settings?.compress_interval_seconds !== undefined && settings?.compress_interval_seconds !== null) ? settings.compress_interval_seconds : 10;
-                        const status = await api('/compress/status');
-                        if (status.running) {
-                            // Currently running, stop it
-                            btn.disabled = true;
-                            await api('/compress/stop', { method: 'POST' });
-                            panel.innerHTML = `<p style="color:#fbbf24">画像圧縮監視を停止中...</p>`;
-                            setTimeout(checkCompressStatus, 500);
-                        } else {
-                            // Not running, start it
-                            btn.disabled = true;
-                            await api('/compress/run', { method: 'POST' });
-                            if (interval === 0) {
-                                panel.innerHTML = `
-                                    <p style="color:#4ade80">画像圧縮を1回実行します</p>
-                                    <p style="color:#94a3b8; margin-top:8px;">処理完了後は自動的に停止します。</p>
-                                `;
-                            } else {
-                                panel.innerHTML = `
-                                    <p style="color:#4ade80">画像圧縮監視を開始しました</p>
-                                    <p style="color:#94a3b8; margin-top:8px;">コピー先フォルダーを${interval}秒毎に監視し、新規・更新された画像を自動圧縮します。</p>
-                                    <p style="color:#94a3b8;">停止するには再度ボタンをクリックしてください。</p>
-                                `;
-                            }
-                            setTimeout(checkCompressStatus, 500);
-                        }
-                    } catch (e) {
-                        panel.innerHTML = `<p style="color:#f472b6">${e.message}</p>`;
-                        btn.disabled = false;
-                        checkCompressStatus();
-                    }
-                }
-
-                async function checkCompressStatus() {
-                    try {
-                        const status = await api('/compress/status');
-                        updateCompressToggleButton(status.running);
-                        document.getElementById('btnCompressToggle').disabled = false;
-                        if (status.running) {
-                            setTimeout(checkCompressStatus, 2000);
-                        }
-                    } catch (e) {
-                        console.error('Compress status check failed:', e);
-                        updateCompressToggleButton(false);
-                        document.getElementById('btnCompressToggle').disabled = false;
-                    }
-                }
-
-                async function toggleUpload() {
-                    const status = await api('/upload/status');
-                    const settings = await api('/settings');
-                    const interval = (settings?.upload_interval_seconds !== undefined && settings?.upload_interval_seconds !== null) ? settings.upload_interval_seconds : 10;
-                    
-                    if (status.running) {
-                        await api('/upload/stop', { method: 'POST' });
-                        panel.innerHTML = '<p style="color:#fbbf24">SFTPアップロード監視を停止中...</p>';
-                        setTimeout(checkUploadStatus, 1000);
-                    } else {
-                        await api('/upload/run', { method: 'POST' });
-                        if (interval === 0) {
-                            panel.innerHTML = '<p style="color:#4ade80">SFTPアップロードを1回実行します。処理完了後は自動的に停止します。</p>';
-                        } else {
-                            panel.innerHTML = '<p style="color:#4ade80">SFTPアップロード監視を開始しました。ログを確認してください。</p>';
-                        }
-                        setTimeout(checkUploadStatus, 1000);
-                    }
-                }
-
-                function updateUploadToggleButton(running) {
-                    const btn = document.getElementById('btnUploadToggle');
-                    if (running) {
-                        btn.textContent = 'SFTPアップ 停止';
-                        btn.style.background = 'linear-gradient(90deg,#ef4444,#dc2626)';
-                    } else {
-                        btn.textContent = 'SFTPアップ 開始';
-                        btn.style.background = 'linear-gradient(90deg,#3b82f6,#2563eb)';
-                    }
-                }
-
-                async function checkUploadStatus() {
-                    try {
-                        const status = await api('/upload/status');
-                        updateUploadToggleButton(status.running);
-                        document.getElementById('btnUploadToggle').disabled = false;
-                        if (status.running) {
-                            setTimeout(checkUploadStatus, 2000);
-                        }
-                    } catch (e) {
-                        console.error('Upload status check failed:', e);
-                        updateUploadToggleButton(false);
-                        document.getElementById('btnUploadToggle').disabled = false;
-                    }
-                }
-
-                document.getElementById('loginBtn').onclick = login;
-                document.getElementById('logoutBtn').onclick = logout;
-                document.getElementById('btnEditSettings').onclick = editSettings;
-                document.getElementById('btnManageUsers').onclick = manageUsers;
-                document.getElementById('btnLogs').onclick = showLogs;
-                document.getElementById('btnClearLogs').onclick = clearLogs;
-                document.getElementById('btnSyncToggle').onclick = toggleSync;
-                document.getElementById('btnCompressToggle').onclick = toggleCompress;
-                document.getElementById('btnUploadToggle').onclick = toggleUpload;
-
-                checkAuth();
-            </script>
-        </body>
-        </html>
-        """
+def root_page(request: Request):
+    headers = dict(_ROOT_HTML_HEADERS)
+    if_none_match = request.headers.get("if-none-match", "")
+    if _ROOT_HTML_ETAG[2:] in if_none_match or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    accepted = {e.split(";", 1)[0].strip() for e in request.headers.get("accept-encoding", "").split(",")}
+    if _ROOT_HTML_BR is not None and "br" in accepted:
+        headers["Content-Encoding"] = "br"
+        return Response(content=_ROOT_HTML_BR, media_type="text/html; charset=utf-8", headers=headers)
+    if "gzip" in accepted:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=_ROOT_HTML_GZ, media_type="text/html; charset=utf-8", headers=headers)
+    return Response(content=_ROOT_HTML_BYTES, media_type="text/html; charset=utf-8", headers=headers)
 
 
 @app.post("/auth/login")
@@ -738,29 +424,33 @@ def login(payload: dict, response: Response):
 
 
 @app.post("/auth/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response):
+    token = request.cookies.get(SESSION_NAME)
+    if token:
+        with _token_cache_lock:
+            _token_cache.pop(token, None)
     response.delete_cookie(SESSION_NAME)
     return {"status": "ok"}
 
 
 @app.get("/auth/me")
-def auth_me(user=Depends(require_auth)):
-    return {"user": user}
+def auth_me(request: Request):
+    return {"user": request.state.user}
 
 
 @app.get("/users")
-def get_users(user=Depends(require_auth)):
+def get_users():
     """Get current login user (without password for security)."""
     user_data = db.load_user()
     if not user_data:
         # Return default if not set
-        return {"username": "admin", "password": "********"}
+        return _DEFAULT_USERS
     # Return masked password for security
-    return {"username": user_data["username"], "password": "********"}
+    return {"username": user_data["username"], "password": _MASKED_PW}
 
 
 @app.post("/users")
-def update_users(payload: dict, user=Depends(require_auth)):
+def update_users(payload: dict):
     """Update login user credentials."""
     username = payload.get("username", "").strip()
     password = payload.get("password", "").strip()
@@ -772,33 +462,43 @@ def update_users(payload: dict, user=Depends(require_auth)):
     
     try:
         db.save_user(username, password)
-        _log("INFO", f"ログインユーザーを更新しました: {username}")
+        _log("INFO", "ログインユーザーを更新しました: %s", username)
         return {"status": "ok", "message": "ユーザー情報が更新されました"}
-    except Exception as e:  # noqa: BLE001
+    except sqlite3.Error as e:
         _log("ERROR", "ユーザー情報の更新に失敗しました", detail=str(e))
         raise HTTPException(status_code=500, detail="ユーザー情報の更新に失敗しました")
 
 
+def _stop_jobs() -> None:
+    # Wake every running job so its loop exits, and drop runs not started yet
+    for stop in (_sync_stop, _compress_stop, _upload_stop):
+        stop.set()
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Executor workers are non-daemon and joined at interpreter exit. Hooks run last
+# registered first, so this stops the jobs before that join even when
+# on_shutdown never ran.
+threading._register_atexit(_stop_jobs)
+
+
 @app.on_event("shutdown")
 def on_shutdown() -> None:
-    pass
+    _stop_jobs()
+    db.stop_log_writer()
+    db.close_connection()
 
 
-@app.get("/settings", response_model=Optional[SftpSettings])
-def get_settings(user=Depends(require_auth)):
-    data = db.load_settings()
-    if not data:
-        return None
-    # Mask password in API responses - use fixed mask string if password exists
-    if data.get("password"):
-        data["password"] = "********"
-    else:
-        data["password"] = None
-    return SftpSettings(**data)
+# Handlers below return trusted, already-validated models. response_model=None
+# skips FastAPI's per-request re-validation; `responses` keeps the OpenAPI schema.
+@app.get("/settings", response_model=None, responses={200: {"model": Optional[SftpSettings]}})
+def get_settings():
+    return _settings_cache.masked()
 
 
 @app.post("/settings", response_model=SftpSettings)
-def set_settings(settings: SftpSettings, user=Depends(require_auth)):
+def set_settings(settings: SftpSettings):
+    global _last_test_ok
     # Basic validations
     if not settings.host or not settings.username:
         raise HTTPException(status_code=422, detail="host/username は必須です")
@@ -813,15 +513,37 @@ def set_settings(settings: SftpSettings, user=Depends(require_auth)):
         raise HTTPException(status_code=422, detail="local_dir は絶対パスで指定してください")
 
     db.save_settings(settings.model_dump())
-    _log("INFO", f"設定を更新しました: ホスト={settings.host}:{settings.port}, リモート={settings.remote_dir}, ローカル={settings.local_dir}")
-    # Mask password in response
-    masked = settings.model_dump()
-    masked["password"] = None
-    return SftpSettings(**masked)
+    # Connection fields may have changed; the next test must really connect
+    _last_test_ok = None
+    # Publish the stored form (password kept when left blank) to running loops
+    _settings_cache.bump(SftpSettings.model_validate(db.load_settings()))
+    _log("INFO", "設定を更新しました: ホスト=%s:%s, リモート=%s, ローカル=%s", settings.host, settings.port, settings.remote_dir, settings.local_dir)
+    # Mask password in response (the model was validated above; no need to rebuild it)
+    return settings.model_copy(update={"password": None})
+
+
+# A successful connection test is remembered this long, so clicking "test" again
+# with unchanged connection settings does not open another SSH session
+_TEST_OK_TTL = 60.0
+# (digest of the connection fields, monotonic time of the success) or None
+_last_test_ok: Optional[tuple[bytes, float]] = None
+
+
+def _connection_signature(settings: SftpSettings) -> bytes:
+    critical = (
+        settings.host,
+        settings.port,
+        settings.username,
+        settings.password,
+        settings.private_key_path,
+        settings.remote_dir,
+    )
+    return hashlib.blake2b(repr(critical).encode(), digest_size=16).digest()
 
 
 @app.post("/settings/test")
-def test_settings(payload: dict, user=Depends(require_auth)):
+def test_settings(payload: dict):
+    global _last_test_ok
     # Merge posted settings with stored ones to allow blank password retaining
     stored = db.load_settings() or {}
     merged = {**stored, **payload}
@@ -829,74 +551,248 @@ def test_settings(payload: dict, user=Depends(require_auth)):
     if not merged.get("password"):
         merged["password"] = stored.get("password")
     try:
-        settings = SftpSettings(**merged)
-        _log("INFO", f"接続テスト開始: {settings.host}:{settings.port}")
+        settings = SftpSettings.model_validate(merged)
+        sig = _connection_signature(settings)
+        last = _last_test_ok
+        if last is not None and last[0] == sig and time.monotonic() - last[1] < _TEST_OK_TTL:
+            _log("INFO", "接続テスト成功 (直前の結果を使用): %s:%s", settings.host, settings.port)
+            return {"ok": True, "cached": True}
+        _log("INFO", "接続テスト開始: %s:%s", settings.host, settings.port)
         test_connection(settings)
-        _log("INFO", f"接続テスト成功: {settings.host}:{settings.port}, リモートディレクトリ={settings.remote_dir}")
+        _last_test_ok = (sig, time.monotonic())
+        _log("INFO", "接続テスト成功: %s:%s, リモートディレクトリ=%s", settings.host, settings.port, settings.remote_dir)
         return {"ok": True}
-    except Exception as exc:  # noqa: BLE001
-        _log("ERROR", f"接続テスト失敗: {merged.get('host')}:{merged.get('port')}", detail=str(exc))
+    # ValueError covers pydantic's ValidationError; OSError a missing or unreadable remote_dir;
+    # EOFError a server that drops the connection mid-session
+    except (SftpConnectionError, paramiko.SSHException, OSError, ValueError, EOFError) as exc:
+        _log("ERROR", "接続テスト失敗: %s:%s", merged.get('host'), merged.get('port'), detail=str(exc))
         raise HTTPException(status_code=400, detail=f"接続テスト失敗: {exc}")
 
 
 @app.post("/sync/run")
-def run_sync(req: SyncRequest, user=Depends(require_auth)):
-    global _running
-    if _running:
+def run_sync(req: SyncRequest):
+    if lock.locked():
         raise HTTPException(status_code=409, detail="同期処理が既に実行中です")
 
     _log("INFO", "手動同期実行: ユーザーによる同期開始要求")
 
-    # Run sync in a separate thread to avoid blocking the request
-    import threading
-    sync_thread = threading.Thread(target=_run_sync, daemon=True)
-    sync_thread.start()
+    # Hand off to the background worker to avoid blocking the request
+    _submit_job("sync", _run_sync)
 
     return {"status": "started", "message": "同期処理を開始しました"}
 
 
 @app.post("/sync/stop")
-def stop_sync(user=Depends(require_auth)):
-    global _stop_requested
-    if not _running:
+def stop_sync():
+    if not lock.locked():
         raise HTTPException(status_code=400, detail="同期処理が実行されていません")
-    _stop_requested = True
+    _sync_stop.set()
     _log("WARN", "同期停止要求: ユーザーによる停止要求")
     return {"status": "stop_requested"}
 
 
 @app.post("/sync/reset")
-def reset_sync_lock(user=Depends(require_auth)):
+def reset_sync_lock():
     """Reset sync lock in case it's stuck"""
-    global _running, _stop_requested
     if lock.locked():
         try:
             lock.release()
             _log("WARN", "同期ロック強制解除: 管理者による操作")
-        except Exception:
+        except RuntimeError:  # released by the worker in the meantime
             pass
-    _running = False
-    _stop_requested = False
+    _sync_stop.clear()
+    _notify_status()
     return {"status": "reset", "message": "ロックをリセットしました"}
 
 
+_LOG_FIELDS = ("id", "created_at", "level", "message", "detail")
+# Upper bound on rows per /logs response; clients page with after_id instead
+_LOGS_MAX_LIMIT = 1000
+
+
+def _stream_logs(limit: int, after_id: int):
+    # Emit the JSON array one fetch batch at a time instead of materializing every row
+    yield b"["
+    sep = b""
+    for rows in db.iter_log_batches(limit, after_id):
+        yield sep + b",".join(orjson.dumps(dict(zip(_LOG_FIELDS, row))) for row in rows)
+        sep = b","
+    yield b"]"
+
+
 @app.get("/logs", response_model=list[LogEntry])
-def get_logs(limit: int = 200, user=Depends(require_auth)):
-    rows = db.list_logs(limit)
-    return [LogEntry(**row) for row in rows]
+def get_logs(limit: int = 200, after_id: int = 0):
+    # StreamingResponse iterates the sync generator in the threadpool, so the
+    # SQLite reads never run on the event loop
+    limit = max(0, min(limit, _LOGS_MAX_LIMIT))
+    return StreamingResponse(_stream_logs(limit, after_id), media_type="application/json")
+
+
+# Seconds between SSE comment lines that keep idle proxies from closing /logs/stream
+_LOG_STREAM_KEEPALIVE = 15.0
+# Row batches buffered per /logs/stream client before the oldest are dropped
+_LOG_STREAM_QUEUE_SIZE = 256
+
+
+def _sse_log_events(rows) -> bytes:
+    return b"".join(
+        b"id: %d\ndata: %s\n\n" % (row[0], orjson.dumps(dict(zip(_LOG_FIELDS, row)))) for row in rows
+    )
+
+
+@app.get("/logs/stream")
+async def stream_logs(request: Request, after_id: int = 0):
+    """Push log rows as Server-Sent Events as soon as the log writer commits them.
+
+    Rows newer than after_id (or the Last-Event-ID header sent by a
+    reconnecting EventSource) are replayed first, oldest first.
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        after_id = max(after_id, int(last_event_id))
+
+    async def events():
+        # Set up here, not in the handler: a client gone before the first
+        # iteration never runs the finally below and would leak the listener
+        loop = asyncio.get_running_loop()
+        batches: asyncio.Queue = asyncio.Queue(maxsize=_LOG_STREAM_QUEUE_SIZE)
+        dropped = False
+
+        def push(rows) -> None:
+            nonlocal dropped
+            if batches.full():
+                # Slow client: drop the oldest batch and re-read the gap from the table
+                batches.get_nowait()
+                dropped = True
+            batches.put_nowait(rows)
+
+        def on_rows(rows) -> None:
+            loop.call_soon_threadsafe(push, rows)
+
+        last_id = after_id
+        # Listen before reading the backlog so nothing written in between is lost
+        db.add_log_listener(on_rows)
+        try:
+            # Without a cursor start from the latest page (newest first)
+            backlog = await run_in_threadpool(db.list_logs, _LOGS_MAX_LIMIT, after_id)
+            if not after_id:
+                backlog.reverse()
+            while True:
+                # Page forward oldest first until caught up, so no rows are skipped
+                while backlog:
+                    last_id = backlog[-1]["id"]
+                    yield _sse_log_events(tuple(row[f] for f in _LOG_FIELDS) for row in backlog)
+                    if len(backlog) < _LOGS_MAX_LIMIT:
+                        backlog = []
+                    else:
+                        backlog = await run_in_threadpool(db.list_logs, _LOGS_MAX_LIMIT, last_id)
+                try:
+                    rows = await asyncio.wait_for(batches.get(), _LOG_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if dropped:
+                    dropped = False
+                    backlog = await run_in_threadpool(db.list_logs, _LOGS_MAX_LIMIT, last_id)
+                    continue
+                rows = [row for row in rows if row[0] > last_id]
+                if rows:
+                    last_id = rows[-1][0]
+                    yield _sse_log_events(rows)
+        finally:
+            db.remove_log_listener(on_rows)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.delete("/logs")
-def delete_logs(user=Depends(require_auth)):
+def delete_logs():
     """Clear all log entries."""
     db.clear_logs()
     _log("INFO", "ログクリア: 管理者による操作")
     return {"status": "ok", "message": "ログをクリアしました"}
 
 
-@app.get("/status", response_model=Status)
-def get_status(user=Depends(require_auth)):
-    return Status(last_run=_last_run, running=_running)
+@app.get("/status", response_model=None, responses={200: {"model": Status}})
+def get_status():
+    return Status.model_construct(last_run=_last_run, running=lock.locked())
+
+
+def _status_snapshot() -> dict:
+    return {
+        "sync": {"running": lock.locked(), "last_run": _last_run},
+        "compress": {"running": compress_lock.locked()},
+        "upload": {"running": upload_lock.locked()},
+    }
+
+
+@app.get("/status/all")
+def get_all_status():
+    """Running state of sync, compression and upload in one response."""
+    return _status_snapshot()
+
+
+@app.get("/ui/bootstrap")
+def ui_bootstrap():
+    """Masked settings plus all job states, so a UI action needs one round trip."""
+    settings = _settings_cache.masked()
+    return {"settings": settings.model_dump() if settings else None, **_status_snapshot()}
+
+
+# =====================
+# Status push (WebSocket)
+# =====================
+
+# Worker threads take/release the job locks and call _notify_status(); a single
+# broadcaster task on the event loop then pushes one frame to every subscriber.
+_status_subscribers: set[WebSocket] = set()
+_status_changed: Optional[asyncio.Event] = None
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _notify_status() -> None:
+    """Thread-safe: wake the broadcaster so subscribers get the current status."""
+    if _event_loop is not None and _status_changed is not None:
+        _event_loop.call_soon_threadsafe(_status_changed.set)
+
+
+async def _broadcast_status() -> None:
+    while True:
+        await _status_changed.wait()
+        _status_changed.clear()
+        frame = orjson.dumps(_status_snapshot()).decode()
+        for ws in list(_status_subscribers):
+            try:
+                await ws.send_text(frame)
+            except Exception:  # noqa: BLE001
+                _status_subscribers.discard(ws)
+
+
+@app.on_event("startup")
+async def start_status_broadcaster() -> None:
+    global _status_changed, _event_loop
+    _event_loop = asyncio.get_running_loop()
+    _status_changed = asyncio.Event()
+    _event_loop.create_task(_broadcast_status())
+
+
+@app.websocket("/ws/status")
+async def status_socket(websocket: WebSocket):
+    await websocket.accept()
+    _status_subscribers.add(websocket)
+    try:
+        await websocket.send_text(orjson.dumps(_status_snapshot()).decode())
+        # Clients only send keep-alive pings; wait for them until disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _status_subscribers.discard(websocket)
 
 
 # =====================
@@ -905,15 +801,11 @@ def get_status(user=Depends(require_auth)):
 
 def _run_compress() -> None:
     """Run image compression watch in background."""
-    global _compress_running, _compress_stop_requested
-
-    settings_data = db.load_settings()
-    if not settings_data:
+    settings = _settings_cache.get()
+    if settings is None:
         _log("WARN", "画像圧縮スキップ: 設定が未構成です")
         return
 
-    settings = SftpSettings(**settings_data)
-
     if not settings.local_dir:
         _log("ERROR", "画像圧縮エラー: コピー先フォルダー(local_dir)が未設定です")
         return
@@ -926,8 +818,9 @@ def _run_compress() -> None:
         _log("INFO", "画像圧縮スキップ: 既に実行中です")
         return
 
-    _compress_running = True
-    _compress_stop_requested = False
+    _compress_stop.clear()
+    _notify_status()
+    set_log_level(settings.log_level)
 
     try:
         quality = settings.compress_quality if settings.compress_quality else 85
@@ -938,7 +831,15 @@ def _run_compress() -> None:
             _log("INFO", "画像圧縮: 1回のみ実行モード")
             try:
                 from image_compress import compress_images_in_folder as compress_once_func
-                compress_once_func(settings.local_dir, settings.compress_output_dir, quality, _log, None, resize_width)
+                compress_once_func(
+                    settings.local_dir,
+                    settings.compress_output_dir,
+                    quality,
+                    _log,
+                    None,
+                    resize_width,
+                    fast_encode=settings.compress_fast_encode,
+                )
                 _log("INFO", "画像圧縮監視終了: 1回実行完了")
             except Exception as exc:  # noqa: BLE001
                 _log("ERROR", "画像圧縮エラー", detail=str(exc))
@@ -948,52 +849,50 @@ def _run_compress() -> None:
                 output_dir=settings.compress_output_dir,
                 quality=quality,
                 log_callback=_log,
-                stop_check=_check_compress_stop_requested,
+                stop_check=_compress_stop.is_set,
                 interval=float(settings.compress_interval_seconds),
                 resize_width=resize_width,
+                fast_encode=settings.compress_fast_encode,
             )
 
             saved_mb = stats['total_saved_bytes'] / (1024 * 1024)
-            _log("INFO", f"画像圧縮監視終了: 処理={stats['compressed_files']}件, スキップ={stats['skipped_files']}件, エラー={stats['error_files']}件, 削減={saved_mb:.2f}MB")
+            _log("INFO", "画像圧縮監視終了: 処理=%d件, スキップ=%d件, エラー=%d件, 削減=%.2fMB", stats['compressed_files'], stats['skipped_files'], stats['error_files'], saved_mb)
 
     except Exception as exc:
         _log("ERROR", "画像圧縮監視失敗", detail=str(exc))
     finally:
-        _compress_running = False
-        _compress_stop_requested = False
+        _compress_stop.clear()
         compress_lock.release()
+        _notify_status()
 
 
 @app.post("/compress/run")
-def run_compress(user=Depends(require_auth)):
+def run_compress():
     """Start image compression watch."""
-    global _compress_running
-    if _compress_running:
+    if compress_lock.locked():
         raise HTTPException(status_code=409, detail="画像圧縮監視が既に実行中です")
 
     _log("INFO", "画像圧縮監視開始: ユーザーによる監視開始要求")
 
-    compress_thread = threading.Thread(target=_run_compress, daemon=True)
-    compress_thread.start()
+    _submit_job("compress", _run_compress)
 
     return {"status": "started", "message": "画像圧縮監視を開始しました"}
 
 
 @app.post("/compress/stop")
-def stop_compress(user=Depends(require_auth)):
+def stop_compress():
     """Stop image compression watch."""
-    global _compress_stop_requested
-    if not _compress_running:
+    if not compress_lock.locked():
         raise HTTPException(status_code=400, detail="画像圧縮監視が実行されていません")
-    _compress_stop_requested = True
+    _compress_stop.set()
     _log("INFO", "画像圧縮監視停止: ユーザーによる停止要求")
     return {"status": "stop_requested"}
 
 
 @app.get("/compress/status")
-def get_compress_status(user=Depends(require_auth)):
+def get_compress_status():
     """Get compression status."""
-    return {"running": _compress_running}
+    return {"running": compress_lock.locked()}
 
 
 # =====================
@@ -1002,15 +901,11 @@ def get_compress_status(user=Depends(require_auth)):
 
 def _run_upload() -> None:
     """Run SFTP upload watch in background."""
-    global _upload_running, _upload_stop_requested
-
-    settings_data = db.load_settings()
-    if not settings_data:
+    settings = _settings_cache.get()
+    if settings is None:
         _log("WARN", "SFTPアップロードスキップ: 設定が未構成です")
         return
 
-    settings = SftpSettings(**settings_data)
-
     if not settings.compress_output_dir:
         _log("ERROR", "SFTPアップロードエラー: 画像圧縮出力先フォルダー(compress_output_dir)が未設定です")
         return
@@ -1023,8 +918,8 @@ def _run_upload() -> None:
         _log("INFO", "SFTPアップロードスキップ: 既に実行中です")
         return
 
-    _upload_running = True
-    _upload_stop_requested = False
+    _upload_stop.clear()
+    _notify_status()
 
     try:
         # 秒数が0の場合は1回のみ実行
@@ -1040,7 +935,7 @@ def _run_upload() -> None:
                     delete_after_upload=False,
                 )
                 uploaded_mb = stats['uploaded_bytes'] / (1024 * 1024)
-                _log("INFO", f"SFTPアップロード監視終了: アップロード={stats['uploaded_files']}件 ({uploaded_mb:.2f}MB), 削除={stats['deleted_files']}件, エラー={stats['error_files']}件")
+                _log("INFO", "SFTPアップロード監視終了: アップロード=%d件 (%.2fMB), 削除=%d件, エラー=%d件", stats['uploaded_files'], uploaded_mb, stats['deleted_files'], stats['error_files'])
             except Exception as exc:  # noqa: BLE001
                 _log("ERROR", "SFTPアップロードエラー", detail=str(exc))
         else:
@@ -1049,49 +944,46 @@ def _run_upload() -> None:
                 remote_dir=settings.remote_output_dir,
                 settings=settings,
                 log=_log,
-                stop_check=_check_upload_stop_requested,
+                stop_check=_upload_stop.is_set,
                 interval=float(settings.upload_interval_seconds),
                 delete_after_upload=False,
             )
 
             uploaded_mb = stats['uploaded_bytes'] / (1024 * 1024)
-            _log("INFO", f"SFTPアップロード監視終了: アップロード={stats['uploaded_files']}件 ({uploaded_mb:.2f}MB), 削除={stats['deleted_files']}件, エラー={stats['error_files']}件")
+            _log("INFO", "SFTPアップロード監視終了: アップロード=%d件 (%.2fMB), 削除=%d件, エラー=%d件", stats['uploaded_files'], uploaded_mb, stats['deleted_files'], stats['error_files'])
 
     except Exception as exc:
         _log("ERROR", "SFTPアップロード監視失敗", detail=str(exc))
     finally:
-        _upload_running = False
-        _upload_stop_requested = False
+        _upload_stop.clear()
         upload_lock.release()
+        _notify_status()
 
 
 @app.post("/upload/run")
-def run_upload(user=Depends(require_auth)):
+def run_upload():
     """Start SFTP upload watch."""
-    global _upload_running
-    if _upload_running:
+    if upload_lock.locked():
         raise HTTPException(status_code=409, detail="SFTPアップロード監視が既に実行中です")
 
     _log("INFO", "SFTPアップロード監視開始: ユーザーによる監視開始要求")
 
-    upload_thread = threading.Thread(target=_run_upload, daemon=True)
-    upload_thread.start()
+    _submit_job("upload", _run_upload)
 
     return {"status": "started", "message": "SFTPアップロード監視を開始しました"}
 
 
 @app.post("/upload/stop")
-def stop_upload(user=Depends(require_auth)):
+def stop_upload():
     """Stop SFTP upload watch."""
-    global _upload_stop_requested
-    if not _upload_running:
+    if not upload_lock.locked():
         raise HTTPException(status_code=400, detail="SFTPアップロード監視が実行されていません")
-    _upload_stop_requested = True
+    _upload_stop.set()
     _log("INFO", "SFTPアップロード監視停止: ユーザーによる停止要求")
     return {"status": "stop_requested"}
 
 
 @app.get("/upload/status")
-def get_upload_status(user=Depends(require_auth)):
+def get_upload_status():
     """Get upload status."""
-    return {"running": _upload_running}
+    return {"running": upload_lock.locked()}
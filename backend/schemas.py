@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -12,11 +12,14 @@ class SftpSettings(BaseModel):
     local_dir: str = Field(..., description="Local client directory to sync")
     compress_output_dir: Optional[str] = Field(None, description="Image compression output directory")
     compress_quality: int = Field(85, description="Image compression quality (1-100)")
+    compress_fast_encode: bool = Field(False, description="Skip optimized Huffman tables: ~2x faster JPEG encode, ~3-8% larger files")
     resize_width_dpi: Optional[int] = Field(None, description="Output image width in pixels (dpi)")
     remote_output_dir: Optional[str] = Field(None, description="SFTP remote directory output destination")
     sync_interval_seconds: int = Field(5, description="SFTP sync watch interval in seconds")
     compress_interval_seconds: int = Field(10, description="Image compression watch interval in seconds")
     upload_interval_seconds: int = Field(10, description="SFTP upload watch interval in seconds")
+    transfer_concurrency: int = Field(4, ge=1, le=16, description="Files transferred in parallel, each on its own SFTP channel of one connection")
+    log_level: Literal["DEBUG", "INFO", "WARN", "ERROR"] = Field("INFO", description="Minimum level for image compression logs")
 
 
 class SyncRequest(BaseModel):
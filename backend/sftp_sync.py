@@ -1,15 +1,130 @@
+import functools
 import os
+import shlex
 import stat
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import paramiko
 
 from schemas import SftpSettings
 
-# Enable paramiko logging for debugging
-paramiko.util.log_to_file('paramiko.log', level=logging.DEBUG)
+# Packet-level paramiko tracing slows every transfer; enable it only for troubleshooting
+if os.getenv("PARAMIKO_DEBUG"):
+    paramiko.util.log_to_file('paramiko.log', level=logging.DEBUG)
+else:
+    logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+# Outstanding 32KB read requests per download. get() with prefetch keeps this
+# many in flight to hide the round trip; an unbounded number can stall large files.
+PREFETCH_REQUESTS = 64
+
+
+# SSH channel window for SFTP sessions. paramiko's 2MB default stalls a pipelined
+# transfer once the window fills on high-latency links.
+SFTP_WINDOW_SIZE = 128 * 1024 * 1024
+
+# Bytes/packets between SSH re-key exchanges. paramiko's 512MB default pauses
+# every transfer while the keys are renegotiated on large syncs.
+REKEY_LIMIT = 2 ** 40
+
+# Seconds an SFTP request may wait for the server. Without it a dead peer blocks
+# a transfer (and the job worker, and process exit) forever.
+SFTP_IO_TIMEOUT = 60
+
+
+def _tune_transport(transport: paramiko.Transport) -> None:
+    """Apply the window and re-key limits to every channel of a new connection."""
+    # Default for channels opened later (SFTP workers, exec) besides _open_sftp's
+    transport.window_size = SFTP_WINDOW_SIZE
+    transport.packetizer.REKEY_BYTES = REKEY_LIMIT
+    transport.packetizer.REKEY_PACKETS = REKEY_LIMIT
+
+
+def _open_sftp_channel(transport: paramiko.Transport) -> paramiko.SFTPClient:
+    sftp = paramiko.SFTPClient.from_transport(transport, window_size=SFTP_WINDOW_SIZE)
+    if sftp is not None:
+        sftp.get_channel().settimeout(SFTP_IO_TIMEOUT)
+    return sftp
+
+
+def _open_sftp(ssh: paramiko.SSHClient) -> paramiko.SFTPClient:
+    return _open_sftp_channel(ssh.get_transport())
+
+
+# Suffix of files still being downloaded; renamed to the real name when complete
+PARTIAL_SUFFIX = ".part"
+
+# Keep download descriptors out of child processes; binary mode on Windows
+_OPEN_FLAGS = getattr(os, "O_CLOEXEC", 0) | getattr(os, "O_BINARY", 0)
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_pkey(path: str, mtime_ns: int, passphrase: Optional[str]) -> paramiko.PKey:
+    try:
+        return paramiko.PKey.from_path(path)
+    except (TypeError, ValueError, paramiko.SSHException):
+        # Encrypted key: cryptography raises TypeError, paramiko PasswordRequiredException.
+        # Only retry with the password then, as passing one for a plain key fails too.
+        if not passphrase:
+            raise
+    return paramiko.PKey.from_path(path, passphrase=passphrase.encode())
+
+
+def _load_pkey(path: str, passphrase: Optional[str] = None) -> paramiko.PKey:
+    """Parse the private key file once; it is read again only after it or the passphrase changes.
+
+    The passphrase decrypts an encrypted key. Failures raise SftpConnectionError.
+    """
+    path = os.path.expanduser(path)
+    try:
+        return _parse_pkey(path, os.stat(path).st_mtime_ns, passphrase)
+    except (OSError, TypeError, ValueError, paramiko.SSHException, paramiko.pkey.UnknownKeyType) as e:
+        raise SftpConnectionError(f"秘密鍵を読み込めません: {path}: {e}") from e
+
+
+class ChannelPool:
+    """Give each worker thread its own SFTP channel on one SSH transport.
+
+    An SFTPClient must not be shared between threads, but one transport carries
+    many channels, so parallel transfers skip extra handshakes and logins.
+    """
+
+    def __init__(self, transport: paramiko.Transport):
+        self._transport = transport
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._clients: List[paramiko.SFTPClient] = []
+
+    def get(self) -> paramiko.SFTPClient:
+        sftp = getattr(self._local, "sftp", None)
+        if sftp is None:
+            sftp = _open_sftp_channel(self._transport)
+            self._local.sftp = sftp
+            with self._lock:
+                self._clients.append(sftp)
+        return sftp
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for sftp in clients:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+
+
+class _TransferStopped(Exception):
+    """Raised from a transfer progress callback when a stop was requested."""
+
+
+class SftpConnectionError(Exception):
+    """Connecting or opening the SFTP session failed; the message is shown to the user."""
 
 
 def _connect(settings: SftpSettings) -> tuple[paramiko.SSHClient, paramiko.SFTPClient]:
@@ -30,9 +145,10 @@ def _connect(settings: SftpSettings) -> tuple[paramiko.SSHClient, paramiko.SFTPC
         }
 
         if settings.private_key_path:
-            # Use key-based authentication
-            connect_kwargs['key_filename'] = settings.private_key_path
-            connect_kwargs['look_for_keys'] = True
+            # Use key-based authentication; the parsed key is reused across reconnects
+            # (the password, if set, is the key's passphrase)
+            connect_kwargs['pkey'] = _load_pkey(settings.private_key_path, settings.password)
+            connect_kwargs['look_for_keys'] = False
             connect_kwargs['allow_agent'] = False
         elif settings.password:
             # Use password authentication
@@ -40,20 +156,27 @@ def _connect(settings: SftpSettings) -> tuple[paramiko.SSHClient, paramiko.SFTPC
             connect_kwargs['look_for_keys'] = False
             connect_kwargs['allow_agent'] = False
         else:
-            raise Exception("パスワードまたは秘密鍵のどちらかが必要です")
+            raise SftpConnectionError("パスワードまたは秘密鍵のどちらかが必要です")
 
         # Connect via SSH
         ssh.connect(**connect_kwargs)
+        _tune_transport(ssh.get_transport())
 
         # Open SFTP session
-        sftp = ssh.open_sftp()
+        sftp = _open_sftp(ssh)
         if sftp is None:
             ssh.close()
-            raise Exception("Failed to open SFTP session")
+            raise SftpConnectionError("Failed to open SFTP session")
 
         return ssh, sftp
-    except Exception as e:
-        raise Exception(f"SFTP接続エラー: {str(e)}")
+    except SftpConnectionError as e:
+        raise SftpConnectionError(f"SFTP接続エラー: {e}") from e
+    except (paramiko.SSHException, OSError, ValueError) as e:
+        # OSError covers socket errors/timeouts; ValueError a malformed host reply
+        raise SftpConnectionError(f"SFTP接続エラー: {e}") from e
+    except EOFError as e:
+        # paramiko's error when the server drops the connection during banner or key exchange
+        raise SftpConnectionError("SFTP接続エラー: サーバーが接続を切断しました") from e
 
 
 def test_connection(settings: SftpSettings) -> None:
@@ -69,31 +192,133 @@ def test_connection(settings: SftpSettings) -> None:
         ssh.close()
 
 
-def _list_remote(sftp: paramiko.SFTPClient, remote_dir: str) -> List[Tuple[str, paramiko.SFTPAttributes]]:
-    """Recursively list all files and directories from remote_dir."""
+def _resolve_link(sftp: paramiko.SFTPClient, path: str, attrs: paramiko.SFTPAttributes) -> paramiko.SFTPAttributes:
+    """Return the attributes of what the symlink at path points to.
+
+    The download follows the link, so the skip and size checks must compare
+    against the target. A dangling link keeps its own attributes.
+    """
+    try:
+        target = sftp.stat(path)
+    except IOError:
+        return attrs
+    target.filename = attrs.filename
+    return target
+
+
+def _list_remote(sftp: paramiko.SFTPClient, remote_dir: str, log) -> Iterator[Tuple[str, paramiko.SFTPAttributes]]:
+    """Yield (path, attrs) for everything under remote_dir, breadth first.
+
+    A worklist replaces recursion, so deep trees cannot hit the recursion limit
+    and callers can consume entries while later folders are still being listed.
+
+    Symlinks are reported with their target's attributes, but linked folders
+    are not descended (so link loops cannot recurse); _list_remote_fast matches.
+    """
+    pending = deque([remote_dir])
+    while pending:
+        directory = pending.popleft()
+        try:
+            entries = sftp.listdir_attr(directory)
+        except Exception as e:
+            # Log error but continue with other items
+            log("ERROR", "[SFTP実行] リモートディレクトリ一覧取得エラー: %s", directory, detail=str(e))
+            continue
+        prefix = directory.rstrip("/") + "/"
+        for entry in entries:
+            remote_path = prefix + entry.filename
+            is_dir = stat.S_ISDIR(entry.st_mode)
+            if stat.S_ISLNK(entry.st_mode):
+                # listdir_attr describes the link itself
+                entry = _resolve_link(sftp, remote_path, entry)
+            yield remote_path, entry
+            if is_dir:
+                pending.append(remote_path)
+
+
+# One NUL-terminated record per entry below the start directory. The path goes
+# last so tabs in a file name survive the split. %Y is the type a symlink
+# points to ("N" dangling, "L" loop), %y the entry's own type.
+_FIND_PRINTF = r"%s\t%A@\t%T@\t%y\t%Y\t%m\t%p\0"
+_FIND_TYPES = {"d": stat.S_IFDIR, "l": stat.S_IFLNK, "f": stat.S_IFREG}
+
+
+def _list_remote_fast(
+    ssh: paramiko.SSHClient, sftp: paramiko.SFTPClient, remote_dir: str
+) -> Optional[List[Tuple[str, paramiko.SFTPAttributes]]]:
+    """List remote_dir recursively with one `find` command instead of a listdir_attr per folder.
+
+    Returns the same (path, attrs) pairs as _list_remote, or None when the server
+    has no shell access or no GNU find so the caller can fall back.
+    """
+    start = remote_dir.rstrip("/") or "/"
+    # No -L: like _list_remote, symlinked folders are not descended, so a link
+    # loop cannot blow up the listing. Links are resolved one by one below.
+    command = f"find {shlex.quote(start)} -mindepth 1 -printf {shlex.quote(_FIND_PRINTF)}"
+    try:
+        _, stdout, _ = ssh.exec_command(command, timeout=60)
+        output = stdout.read()
+        if stdout.channel.recv_exit_status() != 0:
+            return None
+        records = output.decode("utf-8").split("\0")
+    except (paramiko.SSHException, OSError, EOFError, UnicodeDecodeError):
+        return None
+
     items: List[Tuple[str, paramiko.SFTPAttributes]] = []
     try:
-        for entry in sftp.listdir_attr(remote_dir):
-            remote_path = remote_dir.rstrip("/") + "/" + entry.filename
-            items.append((remote_path, entry))
-            if stat.S_ISDIR(entry.st_mode):
-                # Recursively list subdirectories
-                items.extend(_list_remote(sftp, remote_path))
-    except Exception as e:
-        # Log error but continue with other items
-        print(f"Error listing remote directory {remote_dir}: {e}")
+        for record in records:
+            if not record:
+                continue
+            size, atime, mtime, kind, target_kind, mode, path = record.split("\t", 6)
+            attrs = paramiko.SFTPAttributes()
+            attrs.filename = path.rsplit("/", 1)[-1]
+            attrs.st_size = int(size)
+            attrs.st_atime = int(float(atime))
+            attrs.st_mtime = int(float(mtime))
+            attrs.st_mode = _FIND_TYPES.get(kind, stat.S_IFREG) | int(mode, 8)
+            if kind == "l" and target_kind in ("f", "d"):
+                # find reports the link itself; dangling links and loops stay as they are
+                attrs = _resolve_link(sftp, path, attrs)
+            items.append((path, attrs))
+    except ValueError:
+        # Output in an unexpected format, e.g. a find without -printf support
+        return None
     return items
 
 
-def _list_local(base: Path) -> Dict[str, os.stat_result]:
-    results: Dict[str, os.stat_result] = {}
+def _list_local(base: Path) -> Dict[str, Tuple[int, int]]:
+    """Map each file's posix path relative to base to (whole-second mtime, size).
+
+    The pair compares directly against a remote entry's (mtime, size).
+
+    Walks with os.scandir so file types come from the directory listing and
+    relative paths are joined as strings, with no Path object per file.
+    """
+    results: Dict[str, Tuple[int, int]] = {}
     if not base.exists():
         return results
-    for root, _, files in os.walk(base):
-        for fname in files:
-            p = Path(root) / fname
-            rel = p.relative_to(base).as_posix()
-            results[rel] = p.stat()
+    # (directory, relative prefix) pairs still to scan
+    pending = [(os.fspath(base), "")]
+    while pending:
+        directory, prefix = pending.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                rel = prefix + entry.name
+                try:
+                    # Like os.walk, symlinked folders are not descended into
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            pending.append((entry.path, rel + "/"))
+                        continue
+                    st = entry.stat()
+                    results[rel] = (int(st.st_mtime), st.st_size)
+                except OSError:
+                    # Vanished mid-walk or a dangling symlink
+                    continue
     return results
 
 
@@ -104,120 +329,170 @@ def sync_once(settings: SftpSettings, log, should_stop=None) -> Dict[str, int]:
 
     local_base = Path(settings.local_dir)
     local_base.mkdir(parents=True, exist_ok=True)
-    log("INFO", f"ローカルベースディレクトリ作成/確認: {settings.local_dir}")
+    log("INFO", "ローカルベースディレクトリ作成/確認: %s", settings.local_dir)
 
     copied = 0
     skipped = 0
     dirs_created = 0
 
     # Log SFTP connection start
-    log("INFO", f"[SFTP実行] 接続開始: sftp://{settings.username}@{settings.host}:{settings.port}{settings.remote_dir}")
-    log("INFO", f"[SFTP実行] 認証方式: {'秘密鍵' if settings.private_key_path else 'パスワード'}")
+    log("INFO", "[SFTP実行] 接続開始: sftp://%s@%s:%s%s", settings.username, settings.host, settings.port, settings.remote_dir)
+    log("INFO", "[SFTP実行] 認証方式: %s", '秘密鍵' if settings.private_key_path else 'パスワード')
 
     ssh = None
     sftp = None
     try:
         ssh, sftp = _connect(settings)
-        log("INFO", f"[SFTP実行] 接続成功: {settings.host}:{settings.port}")
-        log("INFO", f"[SFTP実行] リモートディレクトリ: {settings.remote_dir}")
-        log("INFO", f"[SFTP実行] ローカルディレクトリ: {settings.local_dir}")
-
-        try:
-            log("INFO", f"[SFTP実行] コマンド: listdir_attr('{settings.remote_dir}') - リモートファイル一覧取得開始")
-            remote_items = _list_remote(sftp, settings.remote_dir)
-            log("INFO", f"[SFTP実行] リモートファイル一覧取得完了: {len(remote_items)}件 (フォルダーとファイル含む)")
-        except Exception as e:
-            log("ERROR", f"[SFTP実行] リモートファイル一覧取得エラー", detail=str(e))
-            raise
+        log("INFO", "[SFTP実行] 接続成功: %s:%s", settings.host, settings.port)
+        log("INFO", "[SFTP実行] リモートディレクトリ: %s", settings.remote_dir)
+        log("INFO", "[SFTP実行] ローカルディレクトリ: %s", settings.local_dir)
 
         try:
-            log("INFO", f"[SFTP実行] ローカルファイル一覧取得開始: {settings.local_dir}")
+            log("INFO", "[SFTP実行] ローカルファイル一覧取得開始: %s", settings.local_dir)
             local_index = _list_local(local_base)
-            log("INFO", f"[SFTP実行] ローカルファイル一覧取得完了: {len(local_index)}件")
+            log("INFO", "[SFTP実行] ローカルファイル一覧取得完了: %d件", len(local_index))
         except Exception as e:
-            log("ERROR", f"[SFTP実行] ローカルファイル一覧取得エラー", detail=str(e))
+            log("ERROR", "[SFTP実行] ローカルファイル一覧取得エラー", detail=str(e))
             raise
 
-        for remote_path, attrs in remote_items:
-            # Check if stop was requested
+        log("INFO", "[SFTP実行] コマンド: find '%s' - リモートファイル一覧取得開始", settings.remote_dir)
+        remote_items = _list_remote_fast(ssh, sftp, settings.remote_dir)
+        if remote_items is None:
+            log("INFO", "[SFTP実行] findが利用できないため listdir_attr('%s') で一覧取得します", settings.remote_dir)
+            # Consumed lazily: folders are listed on this channel while files
+            # already found download on the pool's channels
+            remote_items = _list_remote(sftp, settings.remote_dir, log)
+
+        # Both listings build every path as this prefix + relative path
+        remote_prefix = settings.remote_dir.rstrip("/") + "/"
+
+        def _check_stop(transferred: int, total: int) -> None:
             if should_stop():
-                log("WARN", "同期処理を中断します")
-                break
+                raise _TransferStopped()
 
-            try:
-                if stat.S_ISDIR(attrs.st_mode):
-                    # ensure folder exists
-                    rel_dir = Path(remote_path).relative_to(settings.remote_dir).as_posix()
-                    target_dir = local_base / rel_dir
-                    if not target_dir.exists():
-                        target_dir.mkdir(parents=True, exist_ok=True)
-                        dirs_created += 1
-                        log("INFO", f"[フォルダー作成] {rel_dir}/")
-                    continue
+        def _download(remote_path: str, attrs: paramiko.SFTPAttributes, rel_path: str, target_file: Path, reason: str) -> bool:
+            """Copy one file on this thread's channel; False if a stop interrupted it.
 
-                rel_path = Path(remote_path).relative_to(settings.remote_dir).as_posix()
-                target_file = local_base / rel_path
-                target_file.parent.mkdir(parents=True, exist_ok=True)
-
-                local_stat = local_index.get(rel_path)
-                # Always sync - check for differences and log them
-                if local_stat:
-                    local_mtime = int(local_stat.st_mtime)
-                    remote_mtime = int(attrs.st_mtime)
-                    if local_mtime == remote_mtime and local_stat.st_size == attrs.st_size:
-                        log("INFO", f"[同期] {rel_path} (差異なし - 念のため同期)")
-                    elif local_mtime < remote_mtime:
-                        log("INFO", f"[上書き] {rel_path} (リモートが新しい: ローカル={local_mtime}, リモート={remote_mtime})")
-                    elif local_mtime > remote_mtime:
-                        log("INFO", f"[上書き] {rel_path} (ローカルが新しいがリモートで上書き)")
-                    else:
-                        log("INFO", f"[上書き] {rel_path} (サイズが異なる)")
-                else:
-                    log("INFO", f"[新規] {rel_path} (ローカルに存在しない)")
-
-                file_size_mb = attrs.st_size / (1024 * 1024)
-                log("INFO", f"[コピー開始] {rel_path} ({file_size_mb:.2f} MB)")
-                log("INFO", f"[SFTP実行] コマンド: get '{remote_path}' -> '{target_file}'")
-
-                # Check stop before potentially long copy operation
-                if should_stop():
-                    log("WARN", "同期処理を中断します (コピー前)")
-                    break
-
-                with sftp.open(remote_path, "rb") as src:
-                    with open(target_file, "wb") as dst:
-                        # Read and write in chunks to allow stop checking
-                        chunk_size = 1024 * 1024  # 1MB chunks
-                        while True:
-                            if should_stop():
-                                log("WARN", f"同期処理を中断します (コピー中: {rel_path})")
-                                break
-                            chunk = src.read(chunk_size)
-                            if not chunk:
-                                break
-                            dst.write(chunk)
-
-                os.utime(target_file, (attrs.st_atime, attrs.st_mtime))
-                copied += 1
-                log("INFO", f"[コピー完了] {rel_path} ({file_size_mb:.2f} MB)")
-            except Exception as e:
-                log("ERROR", f"ファイル処理エラー: {remote_path}", detail=str(e))
+            Logs one INFO line per copied file; the start is DEBUG and formatted
+            only when that level is enabled.
+            """
+            # Check stop before potentially long copy operation
+            if should_stop():
+                return False
+            file_size_mb = attrs.st_size / (1024 * 1024)
+            log("DEBUG", "[コピー開始] %s (%.2f MB) get '%s' -> '%s'", rel_path, file_size_mb, remote_path, target_file)
+            # Download beside the target and rename at the end, so neither an
+            # interrupted copy nor the compressor ever sees a truncated image
+            part_file = target_file.with_name(target_file.name + PARTIAL_SUFFIX)
+            try:
+                fd = os.open(part_file, os.O_CREAT | os.O_WRONLY | os.O_TRUNC | _OPEN_FLAGS, 0o666)
+                with os.fdopen(fd, "wb") as dst:
+                    if attrs.st_size and hasattr(os, "posix_fallocate"):
+                        # Reserve the blocks in one go instead of growing the file per write
+                        os.posix_fallocate(fd, 0, attrs.st_size)
+                    # Pipelined download: paramiko keeps PREFETCH_REQUESTS reads in flight
+                    size = channels.get().getfo(
+                        remote_path,
+                        dst,
+                        callback=_check_stop,
+                        prefetch=True,
+                        max_concurrent_prefetch_requests=PREFETCH_REQUESTS,
+                    )
+                if size != attrs.st_size:
+                    raise IOError(f"サイズ不一致: 期待={attrs.st_size}, 受信={size}")
+                os.utime(part_file, (attrs.st_atime, attrs.st_mtime))
+                os.replace(part_file, target_file)
+            except _TransferStopped:
+                # Drop the partial copy so it is not mistaken for a synced file
+                part_file.unlink(missing_ok=True)
+                return False
+            except BaseException:
+                part_file.unlink(missing_ok=True)
+                raise
+            log("INFO", "[コピー] %s (%.2f MB, %s)", rel_path, file_size_mb, reason)
+            return True
+
+        # Several channels on the one transport keep more files in flight than
+        # a single channel, without another SSH handshake per worker. Channels and
+        # threads are only created once a file actually needs copying.
+        channels = ChannelPool(ssh.get_transport())
+        futures = {}
+        listed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=settings.transfer_concurrency, thread_name_prefix="sftp-sync") as executor:
+                for remote_path, attrs in remote_items:
+                    # Check if stop was requested
+                    if should_stop():
+                        log("WARN", "同期処理を中断します")
+                        break
+                    listed += 1
+
+                    try:
+                        rel_path = remote_path[len(remote_prefix):]
+                        if stat.S_ISDIR(attrs.st_mode):
+                            # ensure folder exists
+                            target_dir = local_base / rel_path
+                            if not target_dir.exists():
+                                target_dir.mkdir(parents=True, exist_ok=True)
+                                dirs_created += 1
+                                log("INFO", "[フォルダー作成] %s/", rel_path)
+                            continue
+
+                        # Same mtime and size as the local copy: nothing to do
+                        remote_mtime = int(attrs.st_mtime)
+                        local_entry = local_index.get(rel_path)
+                        if local_entry == (remote_mtime, attrs.st_size):
+                            skipped += 1
+                            continue
+
+                        target_file = local_base / rel_path
+                        target_file.parent.mkdir(parents=True, exist_ok=True)
+                        if local_entry:
+                            local_mtime = local_entry[0]
+                            if local_mtime < remote_mtime:
+                                reason = f"上書き: リモートが新しい ローカル={local_mtime}, リモート={remote_mtime}"
+                            elif local_mtime > remote_mtime:
+                                reason = "上書き: ローカルが新しいがリモートで上書き"
+                            else:
+                                reason = "上書き: サイズが異なる"
+                        else:
+                            reason = "新規"
+
+                        future = executor.submit(_download, remote_path, attrs, rel_path, target_file, reason)
+                        futures[future] = remote_path
+                    except Exception as e:
+                        log("ERROR", "ファイル処理エラー: %s", remote_path, detail=str(e))
+
+                log("INFO", "[SFTP実行] リモートファイル一覧取得完了: %d件 (フォルダーとファイル含む)", listed)
+                if skipped:
+                    log("INFO", "[スキップ] 差異なし: %d件", skipped)
+
+                for future in as_completed(futures):
+                    try:
+                        if future.result():
+                            copied += 1
+                    except Exception as e:
+                        log("ERROR", "ファイル処理エラー: %s", futures[future], detail=str(e))
+        finally:
+            channels.close()
+        if futures and should_stop():
+            log("WARN", "同期処理を中断します (コピー中)")
 
     except Exception as e:
-        log("ERROR", f"SFTP接続または同期処理中にエラーが発生しました: {str(e)}", detail=str(e))
+        log("ERROR", "SFTP接続または同期処理中にエラーが発生しました: %s", e, detail=str(e))
         raise
     finally:
         if sftp:
             try:
                 sftp.close()
             except Exception as e:
-                log("WARN", f"SFTP接続クローズ時にエラー: {str(e)}")
+                log("WARN", "SFTP接続クローズ時にエラー: %s", e)
         if ssh:
             try:
                 ssh.close()
-                log("INFO", f"[SFTP実行] 接続クローズ完了")
-                log("INFO", f"[SFTP実行] 処理サマリー: 作成フォルダー={dirs_created}件, コピー={copied}件, スキップ={skipped}件")
+                log("INFO", "[SFTP実行] 接続クローズ完了")
+                log("INFO", "[SFTP実行] 処理サマリー: 作成フォルダー=%d件, コピー=%d件, スキップ=%d件", dirs_created, copied, skipped)
             except Exception as e:
-                log("WARN", f"[SFTP実行] SSH接続クローズ時にエラー: {str(e)}")
+                log("WARN", "[SFTP実行] SSH接続クローズ時にエラー: %s", e)
 
     return {"copied": copied, "skipped": skipped}
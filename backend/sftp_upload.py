@@ -1,71 +1,212 @@
 """SFTP upload module for uploading compressed images to remote server."""
 
 import os
-import shutil
+import shlex
 import stat
+import tarfile
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 import paramiko
 
+from fs_watch import SWEEP_EVERY_TICKS, ChangeWatcher, sleep_unless_stopped
 from schemas import SftpSettings
+from sftp_sync import ChannelPool, _connect
+
+# Seconds between SSH keepalives on the session watch_and_upload keeps open
+_KEEPALIVE_SECONDS = 30
+
+# Bytes read from the local file per write() call; paramiko splits each into
+# 32KB SFTP WRITE requests, which stay in flight together in pipelined mode
+_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Suffix of files the compressor is still writing; they are renamed when complete
+_PARTIAL_SUFFIX = '.tmp'
+
+# Batches of at least this many files averaging under _TAR_MAX_AVG_SIZE go as one
+# tar stream to a remote `tar -x`, saving the per-file open/close round trips
+_TAR_MIN_FILES = 20
+_TAR_MAX_AVG_SIZE = 1024 * 1024
 
 
 def _connect_for_upload(settings: SftpSettings) -> tuple[paramiko.SSHClient, paramiko.SFTPClient]:
     """Connect to SFTP server for uploading."""
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        connect_kwargs = {
-            'hostname': settings.host,
-            'port': settings.port,
-            'username': settings.username,
-            'timeout': 30,
-            'banner_timeout': 30,
-            'auth_timeout': 30,
-        }
+    return _connect(settings)
 
-        if settings.private_key_path:
-            connect_kwargs['key_filename'] = settings.private_key_path
-            connect_kwargs['look_for_keys'] = True
-            connect_kwargs['allow_agent'] = False
-        elif settings.password:
-            connect_kwargs['password'] = settings.password
-            connect_kwargs['look_for_keys'] = False
-            connect_kwargs['allow_agent'] = False
-        else:
-            raise Exception("パスワードまたは秘密鍵のどちらかが必要です")
-
-        ssh.connect(**connect_kwargs)
-        sftp = ssh.open_sftp()
-        if sftp is None:
+
+def _close_connection(
+    ssh: Optional[paramiko.SSHClient],
+    sftp: Optional[paramiko.SFTPClient],
+    log: Optional[Callable[..., None]] = None,
+) -> None:
+    if sftp:
+        try:
+            sftp.close()
+        except Exception:
+            pass
+    if ssh:
+        try:
             ssh.close()
-            raise Exception("Failed to open SFTP session")
+            if log:
+                log("INFO", "SFTP接続クローズ完了")
+        except Exception:
+            pass
 
-        return ssh, sftp
-    except Exception as e:
-        raise Exception(f"SFTP接続エラー: {str(e)}")
+
+def _add_with_parents(known_dirs: Set[str], remote_path: str) -> None:
+    """Record remote_path and every ancestor of it as existing."""
+    while remote_path and remote_path != '/' and remote_path not in known_dirs:
+        known_dirs.add(remote_path)
+        remote_path = os.path.dirname(remote_path.rstrip('/'))
 
 
-def _ensure_remote_dir(sftp: paramiko.SFTPClient, remote_path: str) -> None:
-    """Ensure remote directory exists, creating if necessary."""
+def _ensure_remote_dir(
+    sftp: paramiko.SFTPClient,
+    remote_path: str,
+    known_dirs: Optional[Set[str]] = None,
+) -> None:
+    """Ensure remote directory exists, creating if necessary.
+
+    Folders in known_dirs are taken as existing without a stat; those found or
+    created are added along with their parents.
+    """
+    if known_dirs is not None and remote_path in known_dirs:
+        return
     try:
         sftp.stat(remote_path)
     except IOError:
         # Directory doesn't exist, create it
         parent = os.path.dirname(remote_path.rstrip('/'))
         if parent and parent != '/':
-            _ensure_remote_dir(sftp, parent)
+            _ensure_remote_dir(sftp, parent, known_dirs)
         sftp.mkdir(remote_path)
+    if known_dirs is not None:
+        _add_with_parents(known_dirs, remote_path)
+
+
+def _make_remote_dirs(transport: paramiko.Transport, remote_dirs: Set[str]) -> bool:
+    """Create remote_dirs with a single `mkdir -p` over an exec channel.
+
+    Returns False when the server allows no command execution (SFTP-only
+    accounts) or mkdir fails; the caller then creates them through SFTP.
+    """
+    command = "mkdir -p -- " + " ".join(shlex.quote(d) for d in sorted(remote_dirs))
+    channel = None
+    try:
+        channel = transport.open_session(timeout=30)
+        channel.settimeout(60)
+        channel.exec_command(command)
+        return channel.recv_exit_status() == 0
+    except (paramiko.SSHException, OSError, EOFError):
+        return False
+    finally:
+        if channel is not None:
+            channel.close()
+
+
+def _remote_listing(
+    sftp: paramiko.SFTPClient,
+    remote_dir: str,
+    cache: Dict[str, Dict[str, paramiko.SFTPAttributes]],
+    known_dirs: Set[str],
+) -> Dict[str, paramiko.SFTPAttributes]:
+    """Return name -> attributes for remote_dir with one listdir_attr request per pass.
+
+    A missing directory lists as empty; one that lists is added to known_dirs.
+    """
+    listing = cache.get(remote_dir)
+    if listing is None:
+        try:
+            listing = {a.filename: a for a in sftp.listdir_attr(remote_dir)}
+            known_dirs.add(remote_dir)
+        except IOError:
+            listing = {}
+        cache[remote_dir] = listing
+    return listing
+
+
+def _has_any_file(directory: str) -> bool:
+    """Return True as soon as a finished (non-partial) file is found under directory.
+
+    Symlinked folders are not descended into, as with os.walk. A missing or
+    unreadable folder counts as empty.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file() and not entry.name.endswith(_PARTIAL_SUFFIX):
+                    return True
+    except OSError:
+        return False
+    # Files at this level first, like os.walk, before descending
+    return any(_has_any_file(path) for path in subdirs)
+
+
+def _upload_tar(
+    transport: paramiko.Transport,
+    remote_dir: str,
+    files: List[Tuple[str, str, str]],
+    stop_check: Callable[[], bool],
+    log: Callable[..., None],
+) -> Optional[List[Tuple[str, int]]]:
+    """Send (local_file, remote_file, rel_path) entries as one tar stream extracted under remote_dir.
+
+    Returns (local_file, size) for each file sent, or None when the server can't
+    run tar (no exec, non-POSIX) so nothing can be assumed uploaded and the
+    caller falls back to SFTP. A stop ends the archive after the current file.
+    """
+    quoted = shlex.quote(remote_dir)
+    channel = None
+    sent: List[Tuple[str, int]] = []
+    try:
+        channel = transport.open_session(timeout=30)
+        channel.settimeout(60)
+        # GNU/BSD tar restore the archived mtimes, which the skip check relies on
+        channel.exec_command(f"mkdir -p -- {quoted} && tar -x -f - -C {quoted}")
+        out = channel.makefile("wb")
+        # dereference: send what a symlink points at, as the SFTP path does
+        with tarfile.open(fileobj=out, mode="w|", bufsize=_UPLOAD_CHUNK_SIZE, dereference=True) as tar:
+            for local_file, _, rel_path in files:
+                if stop_check():
+                    break
+                try:
+                    info = tar.gettarinfo(local_file, arcname=rel_path.replace('\\', '/'))
+                    with open(local_file, "rb") as src:
+                        tar.addfile(info, src)
+                except FileNotFoundError as e:
+                    # Gone since the scan; nothing was written for it
+                    log("WARN", "ファイルアップロード失敗: %s", rel_path, detail=str(e))
+                    continue
+                sent.append((local_file, info.size))
+        # tarfile leaves a caller's fileobj open, and ChannelFile buffers up to
+        # 8 KiB: push the archive tail out before signalling EOF
+        out.close()
+        channel.shutdown_write()
+        status = channel.recv_exit_status()
+        if status != 0:
+            error = channel.makefile_stderr("rb").read().decode("utf-8", "replace").strip()
+            log("WARN", "tar転送に失敗しました (終了コード %d)", status, detail=error or None)
+            return None
+        return sent
+    except (paramiko.SSHException, OSError, EOFError) as e:
+        log("WARN", "tar転送に失敗しました", detail=str(e))
+        return None
+    finally:
+        if channel is not None:
+            channel.close()
 
 
 def upload_file(
     sftp: paramiko.SFTPClient,
     local_file: str,
     remote_file: str,
-    log: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    log: Optional[Callable[..., None]] = None,
+    known_dirs: Optional[Set[str]] = None,
 ) -> dict:
     """
     Upload a single file to SFTP server.
@@ -75,35 +216,51 @@ def upload_file(
         local_file: Local file path
         remote_file: Remote file path
         log: Log callback function
+        known_dirs: Remote directories already known to exist; updated in place
         
     Returns:
         dict with file_size and status
     """
-    def _log(level: str, message: str, detail: Optional[str] = None):
+    def _log(level: str, message: str, *args, detail: Optional[str] = None):
         if log:
-            log(level, message, detail)
+            log(level, message, *args, detail=detail)
 
     try:
         # Ensure remote directory exists
-        remote_dir = os.path.dirname(remote_file)
-        _ensure_remote_dir(sftp, remote_dir)
-
-        # Upload file
-        file_size = os.path.getsize(local_file)
-        file_size_mb = file_size / (1024 * 1024)
-        
-        _log("INFO", f"[アップロード開始] {os.path.basename(local_file)} ({file_size_mb:.2f} MB)")
-        sftp.put(local_file, remote_file)
-        
-        # Set remote file timestamp to match local
-        local_stat = os.stat(local_file)
-        sftp.utime(remote_file, (local_stat.st_atime, local_stat.st_mtime))
-        
-        _log("INFO", f"[アップロード完了] {os.path.basename(local_file)}")
+        _ensure_remote_dir(sftp, os.path.dirname(remote_file), known_dirs)
+
+        # Upload file; size and times come from one fstat of the open file
+        with open(local_file, "rb", buffering=0) as src:
+            local_stat = os.fstat(src.fileno())
+            file_size = local_stat.st_size
+            file_size_mb = file_size / (1024 * 1024)
+
+            # Both ends unbuffered: data goes from one reused buffer straight into
+            # WRITE requests instead of through a bytes object and paramiko's BytesIO
+            buf = bytearray(min(file_size, _UPLOAD_CHUNK_SIZE) or 1)
+            view = memoryview(buf)
+            with sftp.open(remote_file, "wb", bufsize=0) as dst:
+                # Don't wait for each WRITE to be acknowledged. paramiko discards
+                # the status of pipelined WRITE replies, so the size check below
+                # is what catches a failed write (disk full, quota, permission)
+                dst.set_pipelined(True)
+                while n := src.readinto(buf):
+                    dst.write(view[:n])
+                # Push any buffered tail first so no later write bumps the mtime again
+                dst.flush()
+                # Set remote file timestamp to match local
+                dst.utime((local_stat.st_atime, local_stat.st_mtime))
+
+            # Like sftp.put(confirm=True): the only integrity check on the pipelined path
+            remote_size = sftp.stat(remote_file).st_size
+            if remote_size != file_size:
+                raise IOError(f"サイズ不一致: ローカル={file_size}, リモート={remote_size}")
+
+        _log("INFO", "[アップロード] %s (%.2f MB)", os.path.basename(local_file), file_size_mb)
         
         return {'file_size': file_size, 'status': 'success'}
-    except Exception as e:
-        _log("ERROR", f"[アップロードエラー] {os.path.basename(local_file)}", detail=str(e))
+    except (OSError, paramiko.SSHException) as e:
+        _log("ERROR", "[アップロードエラー] %s", os.path.basename(local_file), detail=str(e))
         raise
 
 
@@ -111,9 +268,11 @@ def upload_folder(
     local_dir: str,
     remote_dir: str,
     settings: SftpSettings,
-    log: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    log: Optional[Callable[..., None]] = None,
     stop_check: Optional[Callable[[], bool]] = None,
     delete_after_upload: bool = True,
+    sftp: Optional[paramiko.SFTPClient] = None,
+    files: Optional[Iterable[str]] = None,
 ) -> dict:
     """
     Upload entire folder to SFTP server and optionally delete local files.
@@ -125,13 +284,15 @@ def upload_folder(
         log: Log callback function
         stop_check: Function to check if operation should stop
         delete_after_upload: Delete local files after successful upload
+        sftp: Open session to reuse; when None a connection is made and closed here
+        files: Upload just these paths under local_dir instead of scanning all of it
         
     Returns:
         dict with uploaded_files, uploaded_bytes, deleted_files counts
     """
-    def _log(level: str, message: str, detail: Optional[str] = None):
+    def _log(level: str, message: str, *args, detail: Optional[str] = None):
         if log:
-            log(level, message, detail)
+            log(level, message, *args, detail=detail)
 
     if stop_check is None:
         stop_check = lambda: False
@@ -139,12 +300,13 @@ def upload_folder(
     local_path = Path(local_dir)
     
     if not local_path.exists():
-        _log("WARN", f"アップロード元フォルダーが存在しません: {local_dir}")
+        _log("WARN", "アップロード元フォルダーが存在しません: %s", local_dir)
         return {
             'uploaded_files': 0,
             'uploaded_bytes': 0,
             'deleted_files': 0,
             'error_files': 0,
+            'skipped_files': 0,
         }
 
     stats = {
@@ -152,54 +314,146 @@ def upload_folder(
         'uploaded_bytes': 0,
         'deleted_files': 0,
         'error_files': 0,
+        'skipped_files': 0,
     }
 
     # Collect all files to upload
     files_to_upload = []
-    for root, dirs, files in os.walk(local_dir):
-        if stop_check():
-            _log("WARN", "アップロード処理が停止されました")
-            return stats
-            
-        for filename in files:
-            local_file = os.path.join(root, filename)
-            rel_path = os.path.relpath(local_file, local_dir)
+    if files is not None:
+        base = os.path.abspath(local_dir)
+        for local_file in sorted(set(files)):
+            rel_path = os.path.relpath(os.path.abspath(local_file), base)
+            # Skip paths outside the folder, partial files and files already gone
+            if rel_path.startswith(os.pardir) or local_file.endswith(_PARTIAL_SUFFIX) or not os.path.isfile(local_file):
+                continue
             remote_file = os.path.join(remote_dir, rel_path).replace('\\', '/')
             files_to_upload.append((local_file, remote_file, rel_path))
+    else:
+        for root, dirs, filenames in os.walk(local_dir):
+            if stop_check():
+                _log("WARN", "アップロード処理が停止されました")
+                return stats
+
+            for filename in filenames:
+                if filename.endswith(_PARTIAL_SUFFIX):
+                    continue
+                local_file = os.path.join(root, filename)
+                rel_path = os.path.relpath(local_file, local_dir)
+                remote_file = os.path.join(remote_dir, rel_path).replace('\\', '/')
+                files_to_upload.append((local_file, remote_file, rel_path))
 
     if not files_to_upload:
         _log("INFO", "アップロード対象のファイルがありません")
         return stats
 
-    _log("INFO", f"SFTPアップロード開始: {local_dir} → {remote_dir}")
-    _log("INFO", f"アップロード対象: {len(files_to_upload)}件")
+    _log("INFO", "SFTPアップロード開始: %s → %s", local_dir, remote_dir)
+    _log("INFO", "アップロード対象: %d件", len(files_to_upload))
 
+    own_connection = sftp is None
     ssh = None
-    sftp = None
     uploaded_files = []
+    # One listdir_attr per remote directory replaces a stat per file, and lets
+    # files already on the server with the same size and mtime be skipped
+    remote_listings: Dict[str, Dict[str, paramiko.SFTPAttributes]] = {}
+    known_dirs: Set[str] = set()
 
     try:
-        ssh, sftp = _connect_for_upload(settings)
-        _log("INFO", f"SFTP接続成功: {settings.host}:{settings.port}")
+        if own_connection:
+            ssh, sftp = _connect_for_upload(settings)
+            _log("INFO", "SFTP接続成功: %s:%s", settings.host, settings.port)
 
+        pending = []
         for local_file, remote_file, rel_path in files_to_upload:
             if stop_check():
-                _log("WARN", "アップロード処理を中断します")
                 break
 
             try:
-                result = upload_file(sftp, local_file, remote_file, _log)
-                stats['uploaded_files'] += 1
-                stats['uploaded_bytes'] += result['file_size']
-                uploaded_files.append(local_file)
-            except Exception as e:
+                remote_parent, remote_name = os.path.split(remote_file)
+                listing = _remote_listing(sftp, remote_parent, remote_listings, known_dirs)
+                remote_attr = listing.get(remote_name)
+                if remote_attr is not None:
+                    local_stat = os.stat(local_file)
+                    # upload_file copies the local mtime, so a match means this exact file is there
+                    if remote_attr.st_size == local_stat.st_size and remote_attr.st_mtime == int(local_stat.st_mtime):
+                        stats['skipped_files'] += 1
+                        uploaded_files.append(local_file)
+                        _log("DEBUG", "[スキップ] 変更なし: %s", rel_path)
+                        continue
+                pending.append((local_file, remote_file, rel_path))
+            except (OSError, paramiko.SSHException) as e:
                 stats['error_files'] += 1
-                _log("ERROR", f"ファイルアップロード失敗: {rel_path}", detail=str(e))
+                _log("ERROR", "ファイルアップロード失敗: %s", rel_path, detail=str(e))
+
+        if len(pending) >= _TAR_MIN_FILES and not stop_check():
+            try:
+                total_size = sum(os.path.getsize(local_file) for local_file, _, _ in pending)
+            except OSError:
+                total_size = None
+            if total_size is not None and total_size < _TAR_MAX_AVG_SIZE * len(pending):
+                _log("INFO", "[tarアップロード開始] %d件 (%.2f MB)", len(pending), total_size / (1024 * 1024))
+                sent = _upload_tar(sftp.get_channel().get_transport(), remote_dir, pending, stop_check, _log)
+                if sent is None:
+                    _log("INFO", "SFTPで1件ずつアップロードします")
+                else:
+                    for local_file, file_size in sent:
+                        stats['uploaded_files'] += 1
+                        stats['uploaded_bytes'] += file_size
+                        uploaded_files.append(local_file)
+                    _log("INFO", "[tarアップロード完了] %d件", len(sent))
+                    pending = []
+
+        # Create missing remote folders here so the workers never race on mkdir:
+        # one mkdir -p where the server allows it, else a stat/mkdir per level
+        missing_dirs = {os.path.dirname(remote_file) for _, remote_file, _ in pending} - known_dirs
+        if missing_dirs and _make_remote_dirs(sftp.get_channel().get_transport(), missing_dirs):
+            for remote_parent in missing_dirs:
+                _add_with_parents(known_dirs, remote_parent)
+        for remote_parent in sorted(missing_dirs - known_dirs):
+            try:
+                _ensure_remote_dir(sftp, remote_parent, known_dirs)
+            except (OSError, paramiko.SSHException) as e:
+                # upload_file retries it and reports the affected files
+                _log("WARN", "リモートフォルダー作成エラー: %s", remote_parent, detail=str(e))
+
+        if pending and not stop_check():
+            # Upload on parallel channels of the same connection; one channel
+            # waits a round trip per open/close, which dominates for small images
+            channels = ChannelPool(sftp.get_channel().get_transport())
+
+            def _upload(local_file: str, remote_file: str) -> Optional[dict]:
+                if stop_check():
+                    return None
+                return upload_file(channels.get(), local_file, remote_file, _log, known_dirs)
+
+            workers = min(settings.transfer_concurrency, len(pending))
+            try:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sftp-upload") as executor:
+                    futures = {
+                        executor.submit(_upload, local_file, remote_file): (local_file, rel_path)
+                        for local_file, remote_file, rel_path in pending
+                    }
+                    for future in as_completed(futures):
+                        local_file, rel_path = futures[future]
+                        try:
+                            result = future.result()
+                        except (OSError, paramiko.SSHException) as e:
+                            stats['error_files'] += 1
+                            _log("ERROR", "ファイルアップロード失敗: %s", rel_path, detail=str(e))
+                            continue
+                        if result is not None:
+                            stats['uploaded_files'] += 1
+                            stats['uploaded_bytes'] += result['file_size']
+                            uploaded_files.append(local_file)
+            finally:
+                channels.close()
+
+        if stop_check():
+            _log("WARN", "アップロード処理を中断します")
 
         # Delete uploaded files if requested
-        _log("INFO", f"[DEBUG] delete_after_upload={delete_after_upload}, uploaded_files count={len(uploaded_files)}")
+        _log("DEBUG", "delete_after_upload=%s, uploaded_files count=%s", delete_after_upload, len(uploaded_files))
         if delete_after_upload and uploaded_files:
-            _log("INFO", f"アップロード完了ファイルの削除開始: {len(uploaded_files)}件")
+            _log("INFO", "アップロード完了ファイルの削除開始: %d件", len(uploaded_files))
             
             for local_file in uploaded_files:
                 if stop_check():
@@ -209,9 +463,9 @@ def upload_folder(
                 try:
                     os.remove(local_file)
                     stats['deleted_files'] += 1
-                    _log("INFO", f"[削除完了] {os.path.basename(local_file)}")
-                except Exception as e:
-                    _log("ERROR", f"ファイル削除エラー: {os.path.basename(local_file)}", detail=str(e))
+                    _log("INFO", "[削除完了] %s", os.path.basename(local_file))
+                except OSError as e:
+                    _log("ERROR", "ファイル削除エラー: %s", os.path.basename(local_file), detail=str(e))
 
             # Delete empty directories
             _log("INFO", "空フォルダーの削除を実行します")
@@ -224,28 +478,19 @@ def upload_folder(
                     try:
                         if not os.listdir(dir_path):  # Directory is empty
                             os.rmdir(dir_path)
-                            _log("INFO", f"[空フォルダー削除] {os.path.relpath(dir_path, local_dir)}/")
-                    except Exception as e:
-                        _log("WARN", f"フォルダー削除エラー: {os.path.relpath(dir_path, local_dir)}/", detail=str(e))
+                            _log("INFO", "[空フォルダー削除] %s/", os.path.relpath(dir_path, local_dir))
+                    except OSError as e:
+                        _log("WARN", "フォルダー削除エラー: %s/", os.path.relpath(dir_path, local_dir), detail=str(e))
 
     except Exception as e:
         _log("ERROR", "SFTPアップロード処理エラー", detail=str(e))
         raise
     finally:
-        if sftp:
-            try:
-                sftp.close()
-            except Exception:
-                pass
-        if ssh:
-            try:
-                ssh.close()
-                _log("INFO", "SFTP接続クローズ完了")
-            except Exception:
-                pass
+        if own_connection:
+            _close_connection(ssh, sftp, _log)
 
     uploaded_mb = stats['uploaded_bytes'] / (1024 * 1024)
-    _log("INFO", f"SFTPアップロード完了: アップロード={stats['uploaded_files']}件 ({uploaded_mb:.2f}MB), 削除={stats['deleted_files']}件, エラー={stats['error_files']}件")
+    _log("INFO", "SFTPアップロード完了: アップロード=%d件 (%.2fMB), スキップ=%d件, 削除=%d件, エラー=%d件", stats['uploaded_files'], uploaded_mb, stats['skipped_files'], stats['deleted_files'], stats['error_files'])
 
     return stats
 
@@ -254,7 +499,7 @@ def watch_and_upload(
     local_dir: str,
     remote_dir: str,
     settings: SftpSettings,
-    log: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    log: Optional[Callable[..., None]] = None,
     stop_check: Optional[Callable[[], bool]] = None,
     interval: float = 10.0,
     delete_after_upload: bool = True,
@@ -274,9 +519,9 @@ def watch_and_upload(
     Returns:
         dict with total stats from all cycles
     """
-    def _log(level: str, message: str, detail: Optional[str] = None):
+    def _log(level: str, message: str, *args, detail: Optional[str] = None):
         if log:
-            log(level, message, detail)
+            log(level, message, *args, detail=detail)
 
     local_path = Path(local_dir)
     
@@ -289,72 +534,115 @@ def watch_and_upload(
 
     cycle_count = 0
 
-    _log("INFO", f"SFTPアップロード監視開始: {local_dir} → {remote_dir}")
-    _log("INFO", f"監視間隔: {interval}秒")
+    _log("INFO", "SFTPアップロード監視開始: %s → %s", local_dir, remote_dir)
+    _log("INFO", "監視間隔: %s秒", interval)
 
-    while not (stop_check and stop_check()):
-        cycle_count += 1
+    def stopped() -> bool:
+        return bool(stop_check and stop_check())
 
-        try:
-            # Check if directory exists and has files
-            if not local_path.exists():
-                # Wait for directory to be created
-                for _ in range(int(interval * 10)):
-                    if stop_check and stop_check():
-                        break
-                    time.sleep(0.1)
-                continue
+    # Created once the folder exists; without events every interval is a full check
+    watcher: Optional[ChangeWatcher] = None
+    idle_ticks = 0
+    # Files reported by the last events; None means check the whole folder
+    changed: Optional[Set[str]] = None
 
-            # Check if there are any files to upload
-            has_files = False
-            for root, dirs, files in os.walk(local_dir):
-                if files:
-                    has_files = True
-                    break
+    # One SSH session serves every cycle instead of a handshake per cycle. It is
+    # opened when there is first something to upload and probed before reuse.
+    ssh: Optional[paramiko.SSHClient] = None
+    sftp: Optional[paramiko.SFTPClient] = None
 
-            if not has_files:
-                # No files to upload, wait for next cycle
-                for _ in range(int(interval * 10)):
-                    if stop_check and stop_check():
-                        break
-                    time.sleep(0.1)
-                continue
+    def connection() -> paramiko.SFTPClient:
+        nonlocal ssh, sftp
+        if sftp is not None:
+            try:
+                sftp.stat('.')
+                return sftp
+            except (OSError, EOFError, paramiko.SSHException) as e:
+                _log("WARN", "SFTP接続が切断されています: 再接続します", detail=str(e))
+                _close_connection(ssh, sftp)
+                ssh = sftp = None
+        ssh, sftp = _connect_for_upload(settings)
+        # Keepalives stop idle-timeout firewalls and sshd from dropping the session
+        ssh.get_transport().set_keepalive(_KEEPALIVE_SECONDS)
+        _log("INFO", "SFTP接続成功: %s:%s (監視中は接続を維持します)", settings.host, settings.port)
+        return sftp
 
-            # Upload files
-            _log("INFO", f"[監視サイクル {cycle_count}] ファイル検出 - アップロード処理開始")
-            
-            stats = upload_folder(
-                local_dir=local_dir,
-                remote_dir=remote_dir,
-                settings=settings,
-                log=_log,
-                stop_check=stop_check,
-                delete_after_upload=delete_after_upload,
-            )
-
-            total_stats['uploaded_files'] += stats['uploaded_files']
-            total_stats['uploaded_bytes'] += stats['uploaded_bytes']
-            total_stats['deleted_files'] += stats['deleted_files']
-            total_stats['error_files'] += stats['error_files']
-
-            if stats['uploaded_files'] > 0:
-                uploaded_mb = stats['uploaded_bytes'] / (1024 * 1024)
-                _log("INFO", f"[監視サイクル {cycle_count}] アップロード={stats['uploaded_files']}件 ({uploaded_mb:.2f}MB), 削除={stats['deleted_files']}件")
-
-        except Exception as e:
-            _log("ERROR", f"[監視サイクル {cycle_count}] アップロード処理エラー", detail=str(e))
-            total_stats['error_files'] += 1
-
-        # Wait before next cycle
-        if not (stop_check and stop_check()):
-            for _ in range(int(interval * 10)):
-                if stop_check and stop_check():
-                    break
-                time.sleep(0.1)
+    try:
+        while not stopped():
+            if watcher is None and local_path.exists():
+                watcher = ChangeWatcher(local_dir)
+                if watcher.start():
+                    _log("INFO", "ファイル変更イベント監視を使用します (watchdog)")
+                else:
+                    _log("WARN", "ファイル変更イベント監視を開始できません: 定期スキャンで監視します", detail=watcher.error)
+
+            cycle_count += 1
+
+            try:
+                # Check if there are any files to upload (the folder may not exist yet)
+                if changed is not None:
+                    changed = {p for p in changed if not p.endswith(_PARTIAL_SUFFIX) and os.path.isfile(p)}
+                    has_files = bool(changed)
+                else:
+                    has_files = _has_any_file(local_dir)
+
+                if has_files:
+                    # Upload files
+                    _log("INFO", "[監視サイクル %d] ファイル検出 - アップロード処理開始", cycle_count)
+
+                    stats = upload_folder(
+                        local_dir=local_dir,
+                        remote_dir=remote_dir,
+                        settings=settings,
+                        log=_log,
+                        stop_check=stop_check,
+                        delete_after_upload=delete_after_upload,
+                        sftp=connection(),
+                        files=changed,
+                    )
+
+                    total_stats['uploaded_files'] += stats['uploaded_files']
+                    total_stats['uploaded_bytes'] += stats['uploaded_bytes']
+                    total_stats['deleted_files'] += stats['deleted_files']
+                    total_stats['error_files'] += stats['error_files']
+
+                    if stats['uploaded_files'] > 0:
+                        uploaded_mb = stats['uploaded_bytes'] / (1024 * 1024)
+                        _log("INFO", "[監視サイクル %d] アップロード=%d件 (%.2fMB), 削除=%d件", cycle_count, stats['uploaded_files'], uploaded_mb, stats['deleted_files'])
+
+            except Exception as e:
+                _log("ERROR", "[監視サイクル %d] アップロード処理エラー", cycle_count, detail=str(e))
+                total_stats['error_files'] += 1
+                # Start the next cycle on a fresh session
+                _close_connection(ssh, sftp)
+                ssh = sftp = None
+
+            # Wait before next cycle
+            changed = None
+            if watcher is not None and watcher.active:
+                # Sleep until files change and upload just those; sweep the whole
+                # folder now and then in case an event was missed
+                while not stopped():
+                    events = watcher.wait(interval, stop_check)
+                    if events is not None:
+                        idle_ticks = 0
+                        # An empty set means events were dropped: rescan everything
+                        changed = events or None
+                        break
+                    idle_ticks += 1
+                    if idle_ticks >= SWEEP_EVERY_TICKS:
+                        idle_ticks = 0
+                        break
+            else:
+                sleep_unless_stopped(interval, stop_check)
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        _close_connection(ssh, sftp, _log)
 
-    _log("WARN", f"SFTPアップロード監視停止: 合計{cycle_count}サイクル実行")
+    _log("WARN", "SFTPアップロード監視停止: 合計%dサイクル実行", cycle_count)
     
     total_mb = total_stats['uploaded_bytes'] / (1024 * 1024)
-    _log("INFO", f"SFTPアップロード監視終了: 総アップロード={total_stats['uploaded_files']}件 ({total_mb:.2f}MB), 総削除={total_stats['deleted_files']}件, エラー={total_stats['error_files']}件")
+    _log("INFO", "SFTPアップロード監視終了: 総アップロード=%d件 (%.2fMB), 総削除=%d件, エラー=%d件", total_stats['uploaded_files'], total_mb, total_stats['deleted_files'], total_stats['error_files'])
     
     return total_stats
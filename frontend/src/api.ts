@@ -9,10 +9,13 @@ export type SftpSettings = {
   interval_minutes?: number;
   compress_output_dir?: string;
   compress_quality?: number;
+  compress_fast_encode?: boolean;
   remote_output_dir?: string;
   sync_interval_seconds?: number;
   compress_interval_seconds?: number;
   upload_interval_seconds?: number;
+  transfer_concurrency?: number;
+  log_level?: "DEBUG" | "INFO" | "WARN" | "ERROR";
 };
 
 export type LogEntry = {
@@ -67,7 +70,8 @@ export const api = {
       method: "POST",
       body: JSON.stringify({ force }),
     }),
-  getLogs: (limit = 100) => jsonFetch<LogEntry[]>(`/logs?limit=${limit}`),
+  getLogs: (limit = 100, afterId = 0) =>
+    jsonFetch<LogEntry[]>(`/logs?limit=${limit}&after_id=${afterId}`),
   getStatus: () => jsonFetch<Status>("/status"),
   triggerCompress: () =>
     jsonFetch<{ status: string }>("/compress/run", {
@@ -7,7 +7,7 @@ echo "Starting deployment at $(date)"
 apt-get update -y
 
 # Install Python 3.11 and dependencies
-apt-get install -y python3.11 python3.11-venv python3-pip git libjpeg-dev zlib1g-dev
+apt-get install -y python3.11 python3.11-venv python3-pip git libjpeg-turbo8-dev zlib1g-dev
 
 # Clone repository
 cd /home/ubuntu
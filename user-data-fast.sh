@@ -14,7 +14,7 @@ apt-get update
 apt-get install -y python3.11 python3.11-venv python3-pip git
 
 # Install system dependencies for Pillow
-apt-get install -y libjpeg-dev zlib1g-dev
+apt-get install -y libjpeg-turbo8-dev zlib1g-dev
 
 # Clone repository
 cd /home/ubuntu